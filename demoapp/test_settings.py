@@ -130,6 +130,7 @@ POST_OFFICE = {
         'smtp': 'django.core.mail.backends.smtp.EmailBackend',
         'connection_tester': 'post_office.tests.test_mail.ConnectionTestingBackend',
         'slow_backend': 'demoapp.tests.conftest.SlowTestBackend',
+        'async': 'demoapp.tests.conftest.AsyncTestBackend',
     },
     'TEMPLATE_ENGINE': 'post_office',
     'CELERY_ENABLED': False,
@@ -1,3 +1,4 @@
+import asyncio
 import time
 
 from django.core.mail.backends.base import BaseEmailBackend
@@ -20,3 +21,19 @@ class SlowTestBackend(BaseEmailBackend):
 
     def send_messages(self, email_messages):
         time.sleep(5)
+
+
+class AsyncTestBackend(BaseEmailBackend):
+    """
+    An EmailBackend with a coroutine ``asend_messages``, which records how many deliveries overlap
+    """
+    running = 0
+    max_running = 0
+
+    async def asend_messages(self, email_messages):
+        cls = type(self)
+        cls.running += 1
+        cls.max_running = max(cls.max_running, cls.running)
+        await asyncio.sleep(0.05)
+        cls.running -= 1
+        return len(email_messages)
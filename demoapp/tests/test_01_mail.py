@@ -1,12 +1,15 @@
 import logging
 from datetime import timedelta
 from unittest.mock import patch
+from uuid import uuid4
 from zoneinfo import ZoneInfo
 
 import pytest
-from post_office.mail import create, send, send_many, split_into_batches, get_queued, _send_bulk
+from asgiref.sync import async_to_sync
+from post_office.mail import create, send, send_many, split_into_batches, get_queued, _send_bulk, asend_bulk, \
+    _prepare_emails, claim_queued, dispatch_now, WORKER_ID
 from post_office.models import PRIORITY, EmailModel, EmailAddress, EmailMergeModel, PlaceholderContent, STATUS, \
-    Attachment, Recipient
+    Attachment, Recipient, Log, mime_attachments
 from django.core.exceptions import ValidationError
 import tempfile
 from django.test.utils import CaptureQueriesContext
@@ -15,6 +18,8 @@ from django.utils import timezone
 from django.db.utils import InterfaceError
 
 from post_office.settings import get_available_backends
+from .conftest import AsyncTestBackend
+from post_office.signals import email_queued
 
 
 #from django.conf import settings
@@ -499,6 +504,65 @@ def test_get_queued():
     assert list(get_queued()) == [queued_email, past_email]
 
 
+
+@pytest.mark.django_db
+def test_claim_queued(settings):
+    settings.POST_OFFICE = {**settings.POST_OFFICE, 'BATCH_SIZE': 2}
+    kwargs = {
+        'from_email': 'bob@example.com',
+        'subject': 'Test',
+        'message': 'Message',
+        'language': 'en'
+    }
+    first, second, third = [
+        EmailModel.objects.create(status=STATUS.queued, priority=priority, **kwargs)
+        for priority in (PRIORITY.high, PRIORITY.medium, PRIORITY.low)
+    ]
+
+    claimed = claim_queued()
+    assert claimed == [first, second]
+    for email in EmailModel.objects.filter(id__in=[first.id, second.id]):
+        assert email.leased_by == WORKER_ID
+        assert email.leased_until > timezone.now()
+    assert list(get_queued()) == [third]
+
+    other_worker = uuid4()
+    assert claim_queued(worker_id=other_worker) == [third]
+    assert claim_queued() == []
+
+    # An expired lease makes the emails eligible again
+    EmailModel.objects.filter(id=first.id).update(leased_until=timezone.now() - timedelta(seconds=1))
+    assert claim_queued(worker_id=other_worker) == [first]
+
+    _send_bulk(claimed, uses_multiprocessing=False)
+    for email in EmailModel.objects.filter(id__in=[first.id, second.id]):
+        assert email.status == STATUS.sent
+        assert email.leased_by is None
+        assert email.leased_until is None
+
+
+@pytest.mark.django_db
+def test_send_bulk_releases_expiring_lease(settings):
+    settings.POST_OFFICE = {
+        **settings.POST_OFFICE, 'BATCH_DELIVERY_TIMEOUT': 60, 'LEASE_DURATION': timedelta(seconds=120),
+    }
+    email = EmailModel.objects.create(
+        status=STATUS.queued, from_email='bob@example.com', subject='Test', message='Message', language='en',
+    )
+    claimed = claim_queued()
+    assert claimed == [email]
+
+    # Less time than BATCH_DELIVERY_TIMEOUT is left, so the email is not sent and handed back instead
+    EmailModel.objects.filter(id=email.id).update(leased_until=timezone.now() + timedelta(seconds=30))
+    claimed[0].refresh_from_db()
+    _send_bulk(claimed, uses_multiprocessing=False)
+    email.refresh_from_db()
+    assert email.status == STATUS.queued
+    assert email.leased_by is None
+    assert email.leased_until is None
+    assert claim_queued() == [email]
+
+
 from django.core import mail
 
 
@@ -521,6 +585,38 @@ def test_send_bulk(template):
     assert EmailModel.objects.get(id=email.id).status == STATUS.sent
 
 
+@pytest.mark.django_db
+def test_dispatch_now(template):
+    emails = [
+        send(
+            sender='from@gmail.com',
+            recipients=[f'rec{i}@gmail.com'],
+            template=template,
+            priority='medium',
+            context={'test': 'val'},
+            language='en',
+            backend='error' if i == 2 else 'locmem',
+        )
+        for i in range(4)
+    ]
+    mail.outbox = []
+
+    with patch('post_office.mail.connections.close') as close, CaptureQueriesContext(connection) as ctx:
+        assert dispatch_now(emails, log_level=2) == 3
+    # Backend connections are closed once all emails are sent
+    close.assert_called_once()
+    writes = [query['sql'] for query in ctx.captured_queries if query['sql'].startswith(('UPDATE', 'INSERT'))]
+    assert len(writes) == 2
+
+    assert len(mail.outbox) == 3
+    assert [email.status for email in emails] == [STATUS.sent, STATUS.sent, STATUS.failed, STATUS.sent]
+    assert list(EmailModel.objects.order_by('id').values_list('status', flat=True)) == [
+        STATUS.sent, STATUS.sent, STATUS.failed, STATUS.sent,
+    ]
+    assert Log.objects.filter(status=STATUS.sent).count() == 3
+    assert Log.objects.get(status=STATUS.failed).email == emails[2]
+
+
 @pytest.mark.django_db
 def test_errors(settings, template):
     email_model = send(
@@ -700,3 +796,220 @@ def test_many_extra_attachments(settings, template_with_extra_attachments):
 
     assert sorted([en_attachments[0].name, en_attachments[1].name]) == sorted(['en_attachment.txt','defau.txt'])
     assert sorted([de_attachments[0].name, de_attachments[1].name]) == sorted(['de_attachment.txt','defau.txt'])
+
+
+@pytest.mark.django_db
+def test_send_bulk_concurrent_connections(settings, template):
+    settings.POST_OFFICE = {**settings.POST_OFFICE, 'DELIVERY_CONNECTIONS': 3}
+    emails = [
+        send(
+            sender='from@gmail.com',
+            recipients=[f'rec{i}@gmail.com'],
+            template=template,
+            priority='medium',
+            commit=True,
+            context={'test': 'val'},
+            language='en',
+            backend='locmem',
+        )
+        for i in range(5)
+    ]
+    mail.outbox = []
+
+    # Only the connections of the delivering threads are opened
+    with patch('post_office.models.connections') as calling_thread_connections:
+        assert _send_bulk(emails, uses_multiprocessing=False) == (5, 0, 0)
+    calling_thread_connections.__getitem__.assert_not_called()
+    assert EmailModel.objects.filter(status=STATUS.sent).count() == 5
+    assert sorted(message.to[0] for message in mail.outbox) == [f'rec{i}@gmail.com' for i in range(5)]
+
+
+@pytest.mark.django_db
+def test_asend_bulk(settings, template):
+    settings.POST_OFFICE = {**settings.POST_OFFICE, 'MAX_RETRIES': 0}
+    emails = [
+        send(
+            sender='from@gmail.com',
+            recipients=[f'rec{i}@gmail.com'],
+            template=template,
+            priority='medium',
+            commit=True,
+            context={'test': 'val'},
+            language='en',
+            backend='error' if i == 0 else 'locmem',
+        )
+        for i in range(4)
+    ]
+    mail.outbox = []
+
+    # Preparing the messages opens no thread-local connections, only the pool's are used
+    with patch('post_office.models.connections') as thread_connections:
+        assert async_to_sync(asend_bulk)(emails, log_level=2, max_connections=2) == (3, 1, 0)
+    thread_connections.__getitem__.assert_not_called()
+    assert EmailModel.objects.filter(status=STATUS.sent).count() == 3
+    assert EmailModel.objects.get(id=emails[0].id).status == STATUS.failed
+    assert emails[0].logs.get().exception_type == 'Exception'
+    assert len(mail.outbox) == 3
+
+
+@pytest.mark.django_db
+def test_asend_bulk_concurrent(template):
+    emails = [
+        send(sender='from@gmail.com', recipients=[f'rec{i}@gmail.com'], template=template, priority='medium',
+             context={'test': 'val'}, language='en', backend='async')
+        for i in range(4)
+    ]
+    AsyncTestBackend.max_running = 0
+
+    # ASYNC_CONNECTIONS lets the deliveries overlap by default
+    assert async_to_sync(asend_bulk)(emails) == (4, 0, 0)
+    assert AsyncTestBackend.max_running == 4
+
+    AsyncTestBackend.max_running = 0
+    assert async_to_sync(asend_bulk)(emails, max_connections=2) == (4, 0, 0)
+    assert AsyncTestBackend.max_running == 2
+
+
+@pytest.mark.django_db
+def test_prepare_emails_constant_queries(template):
+    def count_queries(num_emails):
+        EmailModel.objects.all().delete()
+        for i in range(num_emails):
+            send(
+                sender='from@gmail.com',
+                recipients=[f'rec{i}@gmail.com'],
+                cc=[f'cc{i}@gmail.com'],
+                template=template,
+                priority='medium',
+                commit=True,
+                context={'test': 'val'},
+                language='en',
+                attachments={'test.txt': ContentFile(b'Some data...')},
+            )
+        with CaptureQueriesContext(connection) as ctx:
+            emails = list(get_queued())
+            assert _prepare_emails(emails) == []
+        assert emails[0].email_message().to == ['rec0@gmail.com']
+        assert emails[0].email_message().cc == ['cc0@gmail.com']
+        assert len(emails[0].email_message().attachments) == 1
+        return len(ctx.captured_queries)
+
+    assert count_queries(2) == count_queries(6)
+
+
+@pytest.mark.django_db
+def test_prepare_emails_malformed_context(template):
+    good, bad = [
+        send(sender='from@gmail.com', recipients=['rec@gmail.com'], template=template, priority='medium',
+             commit=True, context={'test': 'val'}, language='en')
+        for _ in range(2)
+    ]
+    EmailModel.objects.filter(id=bad.id).update(context={'test': 'val'})
+    emails = list(get_queued())
+    failed = _prepare_emails(emails)
+    assert [email.id for email, _ in failed] == [bad.id]
+    assert next(email for email in emails if email.id == good.id).email_message().to == ['rec@gmail.com']
+
+
+@pytest.mark.django_db
+def test_prepare_emails_reads_attachments_once(template, settings):
+    for i in range(3):
+        send(
+            sender='from@gmail.com',
+            recipients=[f'rec{i}@gmail.com'],
+            template=template,
+            context={'test': 'val'},
+            language='en',
+            attachments={'test.txt': ContentFile(b'Some data...')},
+        )
+    emails = list(get_queued())
+    assert len({email.attachments.get().id for email in emails}) == 1
+
+    with patch.object(Attachment, '_build_mime_attachment', autospec=True,
+                      side_effect=Attachment._build_mime_attachment) as build:
+        assert _prepare_emails(emails) == []
+    assert build.call_count == 1
+    for email in emails:
+        assert email.email_message().attachments == [('test.txt', 'Some data...', 'text/plain')]
+
+
+@pytest.mark.django_db
+def test_attachment_cache_size(settings):
+    small, large = Attachment.objects.bulk_create([Attachment(name='small.txt'), Attachment(name='large.txt')])
+    small.file.save('small.txt', ContentFile(b'x' * 10))
+    large.file.save('large.txt', ContentFile(b'x' * 100))
+    mime_attachments.clear()
+
+    # The size is read when caching, not when the module is imported
+    settings.POST_OFFICE = {**settings.POST_OFFICE, 'ATTACHMENT_CACHE_SIZE': 50}
+    small.get_mime_attachment()
+    large.get_mime_attachment()
+    assert len(mime_attachments) == 1
+    assert mime_attachments.weight == 10
+
+    settings.POST_OFFICE = {**settings.POST_OFFICE, 'ATTACHMENT_CACHE_SIZE': 0}
+    large.get_mime_attachment()
+    assert len(mime_attachments) == 0
+    mime_attachments.clear()
+
+
+@pytest.mark.django_db
+def test_send_many_constant_queries(template_with_extra_attachments):
+    def count_queries(num_recipients, prefix):
+        recipients = [EmailAddress(email=f'{prefix}{i}@gmail.com', preferred_language=['en', 'de'][i % 2])
+                      for i in range(num_recipients)]
+        with CaptureQueriesContext(connection) as ctx:
+            emails = send_many(recipients=recipients, template='test_template', context={'test': 'val'})
+        assert len(emails) == num_recipients
+        assert len({email.message_id for email in emails}) == num_recipients
+        return len(ctx.captured_queries)
+
+    assert count_queries(2, 'few') == count_queries(10, 'many')
+
+    emails = EmailModel.objects.filter(recipients__email__startswith='many').order_by('id')
+    assert [email.language for email in emails[:2]] == ['en', 'de']
+    assert [email.subject for email in emails[:2]] == ['template_subject', 'DE test_subject']
+    assert list(emails[0].attachments.values_list('name', flat=True)) == ['en_attachment.txt']
+    assert not emails[1].attachments.exists()
+
+
+@pytest.mark.django_db
+def test_send_many_chunked(template):
+    queued = []
+
+    def on_queued(sender, emails, **kwargs):
+        queued.append([email.recipients.get().email for email in emails])
+
+    email_queued.connect(on_queued)
+    try:
+        recipients = (f'chunk{i}@gmail.com' for i in range(5))
+        num_queued = send_many(recipients=recipients, template=template, chunk_size=2, return_emails=False)
+    finally:
+        email_queued.disconnect(on_queued)
+
+    assert num_queued == 5
+    assert queued == [['chunk0@gmail.com', 'chunk1@gmail.com'],
+                      ['chunk2@gmail.com', 'chunk3@gmail.com'],
+                      ['chunk4@gmail.com']]
+
+    emails = send_many(recipients=EmailAddress.objects.filter(email__startswith='chunk'), template=template,
+                       chunk_size=2)
+    assert len(emails) == 5
+
+    with pytest.raises(ValueError):
+        send_many(recipients=iter([]), template=template)
+
+    # Chunks are validated as they are consumed, earlier chunks stay queued
+    with pytest.raises(ValidationError):
+        send_many(recipients=iter(['valid@gmail.com', 'invalid']), template=template, chunk_size=1)
+    assert EmailModel.objects.filter(recipients__email='valid@gmail.com').count() == 1
+
+    # Every email gets its own headers
+    emails = send_many(recipients=['first@gmail.com', 'second@gmail.com'], template=template,
+                       headers={'X-Campaign': 'spring'})
+    emails[0].headers['X-Campaign'] = 'changed'
+    assert emails[1].headers == {'X-Campaign': 'spring'}
+
+    # Lists are deduplicated as a whole
+    assert len(send_many(recipients=['dup@gmail.com', 'other@gmail.com', 'dup@gmail.com'], template=template,
+                         chunk_size=1)) == 2
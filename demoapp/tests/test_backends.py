@@ -1,13 +1,20 @@
 import os
 from datetime import timedelta
+from email import message_from_bytes
 from email.mime.image import MIMEImage
 import pathlib
 import pytest
 
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
 from django.core.files.images import File
-from django.core.mail import EmailMultiAlternatives, send_mail, EmailMessage
+from django.core.mail import EmailMultiAlternatives, send_mail, send_mass_mail, EmailMessage
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
-from post_office.models import EmailModel, STATUS, PRIORITY
+from post_office.backends import STREAM_CHUNK_SIZE, SMTPEmailBackend, StreamedAttachment
+from post_office.models import EmailAddress, EmailModel, STATUS, PRIORITY
+from post_office.utils import create_attachments
 
 
 @pytest.mark.django_db
@@ -171,3 +178,92 @@ def test_email_queued_signal(settings, mocker):
     email = EmailModel.objects.latest('id')
     assert email.status == STATUS.queued
     magic_mock.assert_called_once()
+
+
+@pytest.mark.django_db
+def test_send_messages_in_bulk(settings, mocker):
+    settings.EMAIL_BACKEND = 'post_office.EmailBackend'
+    settings.POST_OFFICE = {**settings.POST_OFFICE, 'BATCH_SIZE': 100}
+    magic_mock = mocker.patch('post_office.signals.email_queued.send')
+
+    def queue_messages(count):
+        messages = [
+            (f'Subject {i}', 'Message', 'from@example.com', [f'to{i}@example.com', 'shared@example.com'])
+            for i in range(count)
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            assert send_mass_mail(messages) == 0
+        return len(ctx.captured_queries)
+
+    assert queue_messages(2) == queue_messages(10)
+    assert magic_mock.call_count == 2
+    assert EmailModel.objects.filter(status=STATUS.queued).count() == 12
+
+    email = EmailModel.objects.get(subject='Subject 9', recipient__address__email='to9@example.com')
+    assert sorted(email.email_message().to) == ['shared@example.com', 'to9@example.com']
+    assert email.context == {'recipient': EmailAddress.objects.get(email='to9@example.com').id}
+
+
+@pytest.mark.django_db
+def test_send_messages_validates_emails(settings):
+    settings.EMAIL_BACKEND = 'post_office.EmailBackend'
+    messages = [
+        ('Subject', 'Message', 'from@example.com', ['to@example.com']),
+        ('Subject', 'Message', 'invalid sender', ['to@example.com']),
+    ]
+    with pytest.raises(ValidationError):
+        send_mass_mail(messages)
+    assert not EmailModel.objects.exists()
+
+
+class RecordingSMTP:
+    def __init__(self):
+        self.chunks = []
+
+    def ehlo_or_helo_if_needed(self):
+        pass
+
+    def mail(self, sender):
+        return 250, b'OK'
+
+    def rcpt(self, recipient):
+        return 250, b'OK'
+
+    def docmd(self, cmd):
+        return 354, b'Go ahead'
+
+    def send(self, chunk):
+        self.chunks.append(chunk)
+
+    def getreply(self):
+        return 250, b'OK'
+
+
+@pytest.mark.django_db
+def test_smtp_backend_streams_attachments(settings):
+    settings.POST_OFFICE = {**settings.POST_OFFICE, 'STREAMED_ATTACHMENT_SIZE': 1000}
+    content = os.urandom(STREAM_CHUNK_SIZE * 2 + 10)
+    big, small = create_attachments({'big.bin': ContentFile(content), 'small.bin': ContentFile(b'small')})
+
+    assert big.get_mime_attachment(stream=False) == ('big.bin', content, None)
+    assert small.get_mime_attachment(stream=True) == ('small.bin', b'small', None)
+    streamed = big.get_mime_attachment(stream=True)
+    assert isinstance(streamed, StreamedAttachment)
+
+    message = EmailMessage('subject', '.leading period', 'from@example.com', ['to@example.com'])
+    message.attach(streamed)
+    message.attach(*small.get_mime_attachment(stream=True))
+    backend = SMTPEmailBackend()
+    backend.connection = RecordingSMTP()
+    assert backend.send_messages([message]) == 1
+
+    data = b''.join(backend.connection.chunks)
+    assert data.endswith(b'\r\n.\r\n')
+    # The streamed content is written in several chunks, never as a whole
+    assert max(len(chunk) for chunk in backend.connection.chunks) < len(content)
+    assert b'\r\n..leading period' in data
+
+    parsed = message_from_bytes(data[:-3].replace(b'\r\n..', b'\r\n.'))
+    attachments = {part.get_filename(): part.get_payload(decode=True) for part in parsed.walk()
+                   if part.get_filename()}
+    assert attachments == {'big.bin': content, 'small.bin': b'small'}
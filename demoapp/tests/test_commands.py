@@ -4,12 +4,14 @@ from unittest import mock
 import pytest
 import datetime
 import os
+import signal
 
 from django.core.files.base import ContentFile
 from django.core.management import call_command
 from django.utils.timezone import now
 
 from post_office.mail import send
+from post_office.management.commands.send_queued_mail import Command as SendQueuedMailCommand
 from post_office.models import EmailModel, Attachment, STATUS, EmailAddress
 from post_office.utils import set_recipients
 
@@ -87,6 +89,70 @@ def test_send_queued_mail():
         assert EmailModel.objects.filter(status=STATUS.queued).count() == 0
 
 
+@pytest.mark.django_db(transaction=True)
+def test_send_queued_mail_processes(settings):
+    settings.POST_OFFICE = {**settings.POST_OFFICE, 'BATCH_SIZE': 4}
+    for _ in range(6):
+        EmailModel.objects.create(from_email='from@example.com', status=STATUS.queued, language='en')
+    call_command('send_queued_mail', processes=2)
+    assert EmailModel.objects.filter(status=STATUS.sent).count() == 6
+    assert EmailModel.objects.filter(status=STATUS.queued).count() == 0
+
+
+@pytest.mark.django_db
+def test_send_queued_mail_daemon():
+    EmailModel.objects.create(from_email='from@example.com', status=STATUS.queued, language='en')
+    EmailModel.objects.create(from_email='from@example.com', status=STATUS.queued, language='en')
+    previous_handler = signal.getsignal(signal.SIGTERM)
+    send_queued = SendQueuedMailCommand.send_queued
+
+    def send_queued_and_stop(command):
+        result = send_queued(command)
+        os.kill(os.getpid(), signal.SIGTERM)
+        return result
+
+    with mock.patch('django.db.connection.close', return_value=None), \
+            mock.patch.object(SendQueuedMailCommand, 'send_queued', send_queued_and_stop):
+        call_command('send_queued_mail', '--daemon')
+
+    assert EmailModel.objects.filter(status=STATUS.sent).count() == 2
+    assert signal.getsignal(signal.SIGTERM) is previous_handler
+
+
+@pytest.mark.django_db
+def test_send_queued_mail_daemon_listener_lost():
+    broken_listener, listener = mock.Mock(), mock.Mock()
+    broken_listener.wait.side_effect = OSError('server closed the connection unexpectedly')
+    send_queued = SendQueuedMailCommand.send_queued
+    calls = []
+
+    def send_queued_and_stop(command):
+        calls.append(command.listener)
+        if len(calls) == 3:
+            os.kill(os.getpid(), signal.SIGTERM)
+        return send_queued(command)
+
+    with mock.patch('post_office.notify.QueueListener.create', side_effect=[broken_listener, listener]), \
+            mock.patch.object(SendQueuedMailCommand, 'send_queued', send_queued_and_stop):
+        call_command('send_queued_mail', '--daemon', '--poll-interval', '0.01', '--max-poll-interval', '0.01')
+
+    # The broken listener is replaced by a new one, after polling once meanwhile
+    assert calls == [broken_listener, None, listener]
+    broken_listener.close.assert_called_once()
+    listener.wait.assert_called_once()
+    listener.close.assert_called_once()
+
+
+@pytest.mark.django_db
+def test_send_queued_mail_async():
+    with mock.patch('django.db.connection.close', return_value=None):
+        EmailModel.objects.create(from_email='from@example.com', status=STATUS.queued, language='en')
+        EmailModel.objects.create(from_email='from@example.com', status=STATUS.queued, language='en')
+        call_command('send_queued_mail', '--async')
+        assert EmailModel.objects.filter(status=STATUS.sent).count() == 2
+        assert EmailModel.objects.filter(status=STATUS.queued).count() == 0
+
+
 @pytest.mark.django_db
 def test_successful_deliveries_log():
     with mock.patch('django.db.connection.close', return_value=None):
@@ -1,6 +1,11 @@
 from email.mime.image import MIMEImage
 
+from unittest.mock import patch
+
 import pytest
+from asgiref.sync import async_to_sync
+from django.core import mail
+from django.core.exceptions import ValidationError
 from post_office.models import EmailModel
 from post_office.models import STATUS, PRIORITY, EmailAddress, render_message
 from post_office.utils import set_recipients
@@ -153,9 +158,58 @@ def test_render_message():
     assert render_message(test_message, context={'recipient': test_recipient, 'recipient.first_name': 'Alisa'}) == (
         '<p>Test message Alisa Doe</p>')
 
+    assert render_message('<p style="color: #fff">#c#</p>', test_context) == '<p style="color: #fff">Hello</p>'
+
+    # Substituted values are not scanned for further variables
+    assert render_message('#a# #b#', {'a': '#b#', 'b': 'B'}) == '#b# B'
+
+    sanitized_values = {}
+    render_message('#disallowed_script# #c#', test_context, sanitized_values)
+    assert sanitized_values == {'<script>alert("Hello")</script>': '', 'Hello': 'Hello'}
+
 
 @pytest.mark.django_db
 def test__str(simple_email, recipients):
     assert str(simple_email) == str([str(rec) for rec in recipients])
 
 
+
+
+@pytest.mark.django_db
+def test_adispatch(simple_email):
+    simple_email.backend_alias = 'locmem'
+    mail.outbox = []
+
+    assert async_to_sync(simple_email.adispatch)(log_level=2) == STATUS.sent
+    assert EmailModel.objects.get(id=simple_email.id).status == STATUS.sent
+    assert simple_email.logs.get().status == STATUS.sent
+    assert len(mail.outbox) == 1
+
+    simple_email._cached_email_message = None
+    simple_email.backend_alias = 'error'
+    assert async_to_sync(simple_email.adispatch)(log_level=1) == STATUS.failed
+    assert simple_email.logs.filter(status=STATUS.failed).count() == 1
+
+
+@pytest.mark.django_db
+def test_save_validation(simple_email):
+    simple_email.from_email = 'invalid'
+    with pytest.raises(ValidationError):
+        simple_email.save()
+    with pytest.raises(ValidationError):
+        async_to_sync(simple_email.asave)()
+
+    # Internal updates skip validation
+    simple_email.status = STATUS.sent
+    simple_email.save(update_fields=['status'], validate=False)
+    assert EmailModel.objects.get(id=simple_email.id).status == STATUS.sent
+
+
+@pytest.mark.django_db
+def test_dispatch_skips_validation(simple_email):
+    simple_email.backend_alias = 'locmem'
+    with patch.object(EmailModel, 'full_clean') as full_clean:
+        assert simple_email.dispatch() == STATUS.sent
+        simple_email._cached_email_message = None
+        assert async_to_sync(simple_email.adispatch)() == STATUS.sent
+    full_clean.assert_not_called()
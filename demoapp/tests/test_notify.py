@@ -0,0 +1,75 @@
+import pytest
+from django.db import connection
+
+from post_office.mail import send
+from post_office.notify import QueueListener, notify_queued
+from post_office.signals import email_queued
+
+
+@pytest.fixture
+def notify_channel(settings):
+    settings.POST_OFFICE = {**settings.POST_OFFICE, 'NOTIFY_CHANNEL': 'post_office_test'}
+    email_queued.connect(notify_queued)
+    yield settings.POST_OFFICE['NOTIFY_CHANNEL']
+    email_queued.disconnect(notify_queued)
+
+
+def test_listener_disabled():
+    assert QueueListener.create() is None
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor == 'postgresql', reason='Falls back to polling on other databases only')
+def test_listener_fallback(notify_channel):
+    assert QueueListener.create() is None
+    # Queuing emails still works, without notifying anyone
+    send(recipients=['to@example.com'], sender='from@example.com', subject='Test', message='Message')
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.skipif(connection.vendor != 'postgresql', reason='Requires LISTEN/NOTIFY')
+def test_listener_wakeup(notify_channel):
+    listener = QueueListener.create()
+    try:
+        assert not listener.wait(timeout=0)
+
+        send(recipients=['to@example.com'], sender='from@example.com', subject='Test', message='Message')
+        assert listener.wait(timeout=5)
+        assert not listener.wait(timeout=0)
+
+        listener.interrupt()
+        assert not listener.wait(timeout=5)
+    finally:
+        listener.close()
+
+
+class OldPsycopgConnection:
+    """
+    Mimics a psycopg < 3.2 connection, whose notifies() takes no timeout.
+    """
+
+    def __init__(self, pending):
+        self.pending = pending
+        self.handlers = []
+
+    def notifies(self):
+        raise AssertionError('Blocks until a notification arrives')
+
+    def add_notify_handler(self, handler):
+        self.handlers.append(handler)
+
+    def remove_notify_handler(self, handler):
+        self.handlers.remove(handler)
+
+    def execute(self, query):
+        for notify in self.pending:
+            for handler in self.handlers:
+                handler(notify)
+        self.pending = []
+
+
+def test_listener_drain_old_psycopg():
+    raw_connection = OldPsycopgConnection(pending=['first', 'second'])
+    assert QueueListener._drain(raw_connection) == 2
+    assert QueueListener._drain(raw_connection) == 0
+    assert raw_connection.handlers == []
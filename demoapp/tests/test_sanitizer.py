@@ -0,0 +1,30 @@
+from post_office.sanitizer import clean_html, clean_html_many, sanitized_cache
+
+
+def test_clean_html_cache():
+    sanitized_cache.clear()
+    body = '<p onclick="alert(1)">Hello</p><script>alert("Hello")</script>'
+
+    assert clean_html(body) == '<p>Hello</p>'
+    assert (sanitized_cache.hits, sanitized_cache.misses) == (0, 1)
+
+    assert clean_html(body) == '<p>Hello</p>'
+    assert (sanitized_cache.hits, sanitized_cache.misses) == (1, 1)
+
+
+def test_clean_html_many():
+    sanitized_cache.clear()
+    bodies = ['<b>a</b>', '<script>b</script>', '<b>a</b>']
+
+    assert clean_html_many(bodies) == ['<b>a</b>', '', '<b>a</b>']
+    assert len(sanitized_cache) == 2
+    assert clean_html_many([]) == []
+
+
+def test_clean_html_cache_size(settings):
+    sanitized_cache.clear()
+    settings.POST_OFFICE = {**settings.POST_OFFICE, 'SANITIZER_CACHE_SIZE': 1}
+
+    clean_html_many(['<b>a</b>', '<b>b</b>'])
+    assert len(sanitized_cache) == 1
+    sanitized_cache.clear()
@@ -1,11 +1,12 @@
 import pathlib
+from unittest.mock import patch
 
 import pytest
 from django.core.files.images import ImageFile
+from django.core.files.storage import default_storage
 import re
 from django.template import Context, Template
-from post_office.templatetags.post_office import inline_image, placeholder
-from unittest import mock
+from post_office.templatetags.post_office import image_stats, inline_image, inline_images, placeholder
 
 
 @pytest.mark.django_db
@@ -26,44 +27,38 @@ def test_media(settings):
 
 @pytest.mark.django_db
 def test_absolute_path(settings):
-    template = mock.Mock()
-    template._attached_images = []
     context = Context({'dry_run': False})
-    context.template = template
+    context.attached_images = []
     path = str(settings.BASE_DIR / 'demoapp' / 'tests' / 'assets' / 'logo.png')
     print(path)
     result = inline_image(context, path)
     assert result.startswith('cid:')
-    assert len(template._attached_images) == 1
-    assert template._attached_images[0].get_payload(decode=True) == open(path, 'rb').read()
+    assert len(context.attached_images) == 1
+    assert context.attached_images[0].get_payload(decode=True) == open(path, 'rb').read()
 
 
 @pytest.mark.django_db
 def test_fileobj(settings):
-    template = mock.Mock()
-    template._attached_images = []
     context = Context({'dry_run': False})
-    context.template = template
+    context.attached_images = []
     path = str(settings.BASE_DIR / 'demoapp' / 'tests' / 'assets' / 'logo.png')
     file = ImageFile(open(path, 'rb'))
     result = inline_image(context, file)
     assert result.startswith('cid:')
-    assert len(template._attached_images) == 1
-    assert template._attached_images[0].get_payload(decode=True) == open(path, 'rb').read()
+    assert len(context.attached_images) == 1
+    assert context.attached_images[0].get_payload(decode=True) == open(path, 'rb').read()
 
 
 def test_media_urls(settings):
     settings.MEDIA_ROOT = str(settings.BASE_DIR / 'demoapp' / 'tests' / 'assets')
-    template = mock.Mock()
-    template._attached_images = []
     context = Context({'dry_run': False})
-    context.template = template
+    context.attached_images = []
     filename = 'logo.png'
     abs_path = f"{settings.MEDIA_ROOT}/{filename}"
     result = inline_image(context, filename)
     assert result.startswith('cid:')
-    assert len(template._attached_images) == 1
-    assert template._attached_images[0].get_payload(decode=True) == open(abs_path, 'rb').read()
+    assert len(context.attached_images) == 1
+    assert context.attached_images[0].get_payload(decode=True) == open(abs_path, 'rb').read()
 
 
 def test_placeholders():
@@ -72,16 +67,14 @@ def test_placeholders():
 
 def test_static(settings):
     settings.STATICFILES_DIRS = [str(settings.BASE_DIR / 'demoapp' / 'tests' / 'assets')]
-    template = mock.Mock()
-    template._attached_images = []
     context = Context({'dry_run': False})
-    context.template = template
+    context.attached_images = []
     filename = 'logo.png'
     abs_path = str(settings.BASE_DIR / 'demoapp' / 'tests' / 'assets' / filename)
     result = inline_image(context, pathlib.Path('assets') / filename)
     assert result.startswith('cid:')
-    assert len(template._attached_images) == 1
-    assert template._attached_images[0].get_payload(decode=True) == open(abs_path, 'rb').read()
+    assert len(context.attached_images) == 1
+    assert context.attached_images[0].get_payload(decode=True) == open(abs_path, 'rb').read()
 
     assert inline_image(context, 'invalid.png') == ''
 
@@ -89,3 +82,52 @@ def test_static(settings):
 
     with pytest.raises(FileNotFoundError):
         inline_image(context, 'invalid.png')
+
+
+@pytest.mark.django_db
+def test_inline_image_cached(settings):
+    context = Context({'dry_run': False})
+    context.attached_images = []
+    path = str(settings.BASE_DIR / 'demoapp' / 'tests' / 'assets' / 'logo.png')
+    inline_images.clear()
+
+    result = inline_image(context, path)
+    # Rendering the same image again reuses the same part and Content-ID
+    assert inline_image(context, path) == result
+    assert len(context.attached_images) == 1
+    assert (inline_images.hits, inline_images.misses) == (1, 1)
+
+    context.attached_images = []
+    assert inline_image(context, path) == result
+    assert context.attached_images[0]['Content-ID'] == f'<{result[4:]}>'
+
+
+@pytest.mark.django_db
+def test_inline_image_stat_cached(settings):
+    context = Context({'dry_run': False})
+    context.attached_images = []
+    path = str(settings.BASE_DIR / 'demoapp' / 'tests' / 'assets' / 'logo.png')
+    image_stats.clear()
+
+    with patch.object(default_storage, 'get_modified_time', wraps=default_storage.get_modified_time) as stat:
+        inline_image(context, path)
+        inline_image(context, path)
+        assert stat.call_count == 1
+
+        settings.POST_OFFICE = {**settings.POST_OFFICE, 'INLINE_IMAGE_CACHE_TIMEOUT': 0}
+        inline_image(context, path)
+        assert stat.call_count == 2
+
+
+@pytest.mark.django_db
+def test_inline_image_without_modified_time(settings):
+    context = Context({'dry_run': False})
+    context.attached_images = []
+    path = str(settings.BASE_DIR / 'demoapp' / 'tests' / 'assets' / 'logo.png')
+    image_stats.clear()
+
+    # Like the base Storage, some storages do not implement get_modified_time()
+    with patch.object(default_storage, 'get_modified_time', side_effect=NotImplementedError):
+        result = inline_image(context, path)
+        assert inline_image(context, path) == result
+    assert len(context.attached_images) == 1
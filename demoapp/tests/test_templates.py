@@ -1,5 +1,17 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
 import pytest
+from django.core.files.images import ImageFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from post_office.cache_utils import get_placeholders, placeholders_cache
+from post_office.mail import send
+from post_office.models import EmailModel, compiled_templates
 from post_office.models import EmailMergeModel, PlaceholderContent, EmailAddress, EmailMergeContentModel
+from post_office.settings import get_template_engine
 
 
 @pytest.fixture
@@ -106,3 +118,117 @@ def test_render_template(test_template):
                    '</html>').strip()
 
     assert clean == html_string
+
+
+@pytest.mark.django_db
+def test_compiled_template_cache(settings, test_template):
+    compiled_templates.clear()
+    test_template.render_email_template(language='en')
+    test_template.render_email_template(language='en')
+    assert len(compiled_templates) == 1
+    assert compiled_templates.hits == 1
+
+    placeholder = test_template.contents.get(placeholder_name='test1', language='en')
+    logo = settings.BASE_DIR / 'demoapp' / 'tests' / 'assets' / 'logo.png'
+    placeholder.content = f'<p>Updated</p><img src="{{% inline_image \'{logo}\' %}}">'
+    placeholder.save()
+    assert len(compiled_templates) == 0
+
+    rendered = test_template.render_email_template(language='en')
+    assert '<p>Updated</p>' in rendered
+    assert "{% inline_image" in rendered
+
+    email = send(recipients=['to@example.com'], template=test_template, context={'test_var': 'VALUE'}, language='en')
+    message = email.email_message()
+    html = message.alternatives[0][0] if message.alternatives else message.body
+    assert '<p>Updated</p>' in html
+    assert html.count('cid:') == 1
+    assert len(message.attachments) == 1
+
+    # Rendering another email from the cached template only attaches its own images
+    email = send(recipients=['to@example.com'], template=test_template, context={'test_var': 'VALUE'}, language='en')
+    assert len(email.email_message().attachments) == 1
+
+
+@pytest.mark.django_db
+def test_placeholders_cache(settings, test_template, capsys):
+    settings.POST_OFFICE_CACHE = True
+    settings.POST_OFFICE_PLACEHOLDERS_CACHE = True
+    placeholders_cache.clear()
+
+    placeholders = get_placeholders(test_template, language='en')
+    assert isinstance(placeholders, list)
+    with CaptureQueriesContext(connection) as ctx:
+        assert get_placeholders(test_template, language='en') == placeholders
+    assert len(ctx.captured_queries) == 0
+    assert capsys.readouterr().out == ''
+
+    placeholder = test_template.contents.get(placeholder_name='test1', language='en')
+    placeholder.content = 'Updated'
+    placeholder.save()
+    test_template.refresh_from_db()
+    assert 'Updated' in [p.content for p in get_placeholders(test_template, language='en')]
+
+    placeholder.delete()
+    test_template.refresh_from_db()
+    assert placeholder.placeholder_name not in [p.placeholder_name for p in get_placeholders(test_template, 'en')]
+
+
+@pytest.mark.django_db
+def test_render_cache(settings, test_template):
+    settings.POST_OFFICE = {**settings.POST_OFFICE, 'RENDER_CACHE_ENABLED': True}
+    placeholder = test_template.contents.get(placeholder_name='test1', language='en')
+    logo = str(settings.BASE_DIR / 'demoapp' / 'tests' / 'assets' / 'logo.png')
+    placeholder.content = f'<p>Cached</p><img src="{{% inline_image \'{logo}\' %}}">'
+    placeholder.save()
+    test_template.refresh_from_db()
+
+    email = send(recipients=['to@example.com'], template=test_template, context={'test_var': 'VALUE'}, language='en')
+    message = email.email_message()
+    assert EmailModel.objects.get(id=email.id).rendered['images'] == [logo]
+
+    # Other instances of the email reuse the stored rendering, including inline images
+    with patch.object(EmailModel, 'render_parts') as render_parts:
+        cached_message = EmailModel.objects.get(id=email.id).email_message()
+    render_parts.assert_not_called()
+    assert cached_message.subject == message.subject
+    assert cached_message.alternatives == message.alternatives
+    assert [part['Content-ID'] for part in cached_message.attachments] == [
+        part['Content-ID'] for part in message.attachments
+    ]
+
+    # So do changes of the recipient and of the inline images
+    EmailAddress.objects.filter(email='to@example.com').update(first_name='Changed')
+    with patch.object(EmailModel, 'render_parts', autospec=True, side_effect=EmailModel.render_parts) as render_parts:
+        EmailModel.objects.get(id=email.id).email_message()
+    render_parts.assert_called_once()
+    EmailModel.objects.filter(id=email.id).update(rendered={
+        **EmailModel.objects.get(id=email.id).rendered, 'content_ids': ['<replaced>'],
+    })
+    with patch.object(EmailModel, 'render_parts', autospec=True, side_effect=EmailModel.render_parts) as render_parts:
+        EmailModel.objects.get(id=email.id).email_message()
+    render_parts.assert_called_once()
+
+    # Changing the template renders the email again
+    placeholder.content = '<p>Changed</p>'
+    placeholder.save()
+    message = EmailModel.objects.get(id=email.id).email_message()
+    assert '<p>Changed</p>' in message.alternatives[0][0]
+    assert EmailModel.objects.get(id=email.id).rendered['images'] == []
+
+
+def test_inline_images_concurrent_renderings(settings):
+    template = get_template_engine().from_string(
+        '{% load post_office %}{% for image in images %}<img src="{% inline_image image %}">{% endfor %}'
+    )
+    logo = (settings.BASE_DIR / 'demoapp' / 'tests' / 'assets' / 'logo.png').read_bytes()
+
+    def render(i):
+        # Each rendering references its own images, or none at all
+        images = [ImageFile(io.BytesIO(logo + b'%d-%d' % (i, n))) for n in range(i % 3)]
+        html, attached_images = template.render_with_images({'images': images})
+        return html.count('cid:'), len(attached_images)
+
+    with ThreadPoolExecutor(8) as executor:
+        for cid_count, image_count in executor.map(render, range(200)):
+            assert cid_count == image_count
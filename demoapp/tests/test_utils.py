@@ -4,15 +4,68 @@ from datetime import datetime
 from django.core.files import File
 from django.core.files.base import ContentFile
 import pytest
+from post_office import utils
 from post_office.utils import set_recipients, get_recipients_objects, parse_emails, parse_priority, split_emails, \
-    create_attachments, send_mail, get_email_template, cleanup_expired_mails, get_language_from_code
+    create_attachments, send_mail, get_email_template, cleanup_expired_mails, get_language_from_code, \
+    resolve_addresses
 from post_office.models import EmailAddress, EmailModel, PRIORITY, Attachment, STATUS, EmailMergeModel
 from django.core.exceptions import ValidationError
 from django.core.files.storage import default_storage, FileSystemStorage
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from post_office import cache
+from post_office.cache_utils import templates_cache
 
 from post_office.settings import get_attachments_storage
 
-from post_office.validators import validate_email_with_name, validate_template_syntax
+from post_office.validators import get_invalid_emails, validate_email_with_name, validate_template_syntax
+
+
+@pytest.mark.django_db
+def test_resolve_addresses(monkeypatch):
+    existing = EmailAddress.objects.create(email='existing@example.com')
+    blocked = EmailAddress.objects.create(email='blocked@example.com', is_blocked=True)
+    unsaved = EmailAddress(email='unsaved@example.com', first_name='Alice')
+    emails = ['existing@example.com', 'blocked@example.com', 'new@example.com', unsaved, 'new@example.com']
+
+    with CaptureQueriesContext(connection) as ctx:
+        addresses = resolve_addresses(emails)
+    # One select, one insert and one select of the inserted addresses
+    assert len(ctx.captured_queries) == 3
+    assert addresses == {
+        'existing@example.com': existing,
+        'blocked@example.com': blocked,
+        'new@example.com': EmailAddress.objects.get(email='new@example.com'),
+        'unsaved@example.com': unsaved,
+    }
+    assert unsaved.pk == EmailAddress.objects.get(email='unsaved@example.com', first_name='Alice').pk
+    assert get_recipients_objects(emails, addresses) == [
+        existing, addresses['new@example.com'], unsaved,
+    ]
+
+    # Addresses are resolved in chunks
+    monkeypatch.setattr(utils, 'ADDRESS_CHUNK_SIZE', 2)
+    emails = [f'chunked{i}@example.com' for i in range(5)]
+    with CaptureQueriesContext(connection) as ctx:
+        assert list(resolve_addresses(emails)) == emails
+    assert len(ctx.captured_queries) == 9
+
+
+@pytest.mark.django_db
+def test_resolve_addresses_concurrently_created(monkeypatch):
+    bulk_create = EmailAddress.objects.bulk_create
+
+    def create_concurrently(objs, **kwargs):
+        # Another process inserts one of the addresses meanwhile
+        EmailAddress.objects.create(email='first@example.com')
+        return bulk_create(objs, **kwargs)
+
+    monkeypatch.setattr(EmailAddress.objects, 'bulk_create', create_concurrently)
+    addresses = resolve_addresses(['first@example.com', 'second@example.com'])
+    assert [address.pk for address in addresses.values()] == list(
+        EmailAddress.objects.order_by('pk').values_list('pk', flat=True)
+    )
 
 
 @pytest.mark.django_db
@@ -109,6 +162,29 @@ def test_parse_emails():
     with pytest.raises(ValidationError):
         parse_emails(['invalida_email', 'test@exmaple.com'])
 
+    # All invalid addresses are reported at once
+    with pytest.raises(ValidationError) as excinfo:
+        parse_emails(['invalid', 'test@exmaple.com', 'Al <>', 'invalid'])
+    assert excinfo.value.messages == [
+        'invalid is not a valid email address', 'Al <> is not a valid email address',
+    ]
+
+
+def test_get_invalid_emails():
+    values = [
+        'plain@example.com', 'first.last+tag@sub.example.co.id', 'Alice <alice@example.com>', 'user@localhost',
+        'user@[127.0.0.1]', 'user@b\u00fccher.example', '"quoted user"@example.com', '\u212a@example.com',
+        'invalid', 'a@b', 'a..b@example.com', '.a@example.com', 'a@-example.com', 'a@example.c0m-', 'Al <ab>',
+        'a@example.com\n', 'a' * 310 + '@example.com', '',
+    ]
+    expected = []
+    for value in values:
+        try:
+            validate_email_with_name(value)
+        except ValidationError:
+            expected.append(value)
+    assert get_invalid_emails(values + values) == expected
+
 
 def test_parse_priority(settings):
     settings.POST_OFFICE['DEFAULT_PRIORITY'] = 'low'
@@ -159,6 +235,47 @@ def test_get_template(settings, test_template):
     assert get_email_template('test_name') == test_template
 
 
+@pytest.mark.django_db
+def test_get_template_cached(settings, test_template):
+    settings.POST_OFFICE_CACHE = True
+    settings.POST_OFFICE_TEMPLATE_CACHE = True
+    settings.POST_OFFICE = {**settings.POST_OFFICE, 'TEMPLATE_CACHE_TIMEOUT': 60}
+    cache.cache_backend.clear()
+    templates_cache.clear()
+    test_template.extra_recipients.add(EmailAddress.objects.create(email='bcc@example.com'))
+
+    template = get_email_template('test_name')
+    with CaptureQueriesContext(connection) as ctx:
+        assert get_email_template('test_name') is template
+        # Contents and extra recipients come along with the template
+        assert template.get_translated_content('en').subject == 'test_subject'
+        assert list(template.get_translated_content('en').extra_attachments.all()) == []
+        assert [address.email for address in template.extra_recipients.all()] == ['bcc@example.com']
+    assert len(ctx.captured_queries) == 0
+
+    # Other processes read it from the cache backend
+    templates_cache.clear()
+    with CaptureQueriesContext(connection) as ctx:
+        assert get_email_template('test_name') == test_template
+    assert len(ctx.captured_queries) == 0
+
+    # Changes are picked up right away in this process ...
+    stale = templates_cache.get('test_name')
+    content = test_template.translated_contents.get(language='en')
+    content.subject = 'Updated'
+    content.save()
+    assert get_email_template('test_name').get_translated_content('en').subject == 'Updated'
+
+    # ... and by other processes once they check the version of their copy
+    templates_cache.set('test_name', stale)
+    assert get_email_template('test_name').get_translated_content('en').subject == 'test_subject'
+    settings.POST_OFFICE = {**settings.POST_OFFICE, 'TEMPLATE_CACHE_TIMEOUT': 0}
+    assert get_email_template('test_name').get_translated_content('en').subject == 'Updated'
+
+    test_template.extra_recipients.clear()
+    assert list(get_email_template('test_name').extra_recipients.all()) == []
+
+
 @pytest.mark.django_db
 def test_create_attachment():
     attachments = create_attachments(
@@ -264,6 +381,28 @@ def test_cleanup_expired():
     assert Attachment.objects.count() == 0
 
 
+@pytest.mark.django_db
+def test_create_attachments_deduplicated():
+    storage = get_attachments_storage()
+    first = create_attachments({'report.pdf': ContentFile(b'report'), 'other.pdf': ContentFile(b'report')})
+    second = create_attachments({'report.pdf': ContentFile(b'report')})
+
+    # Same content, name and headers share the row, same content alone still shares the file
+    assert second[0].id == first[0].id
+    assert first[1].id != first[0].id
+    assert first[1].file.name == first[0].file.name
+    assert Attachment.objects.count() == 2
+
+    email = EmailModel.objects.create(from_email='test@email.com', language='en')
+    email.attachments.set(first[:1])
+    assert cleanup_expired_mails(datetime.min) == (0, 1)
+    assert storage.exists(first[0].file.name)
+
+    email.delete()
+    assert cleanup_expired_mails(datetime.min) == (0, 1)
+    assert not storage.exists(first[0].file.name)
+
+
 def test_template_syntax():
     validate_template_syntax("<h1>{{ test.value }}"
                              "{% for template in test.values %}"
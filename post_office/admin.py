@@ -95,7 +95,8 @@ class LogInline(admin.TabularInline):
 
 def requeue(modeladmin, request, queryset):
     """An admin action to requeue emails."""
-    queryset.update(status=STATUS.queued)
+    # Emails leased by a worker would otherwise only be sent once the lease has expired
+    queryset.update(status=STATUS.queued, leased_by=None, leased_until=None)
 
 
 requeue.short_description = 'Requeue selected emails'
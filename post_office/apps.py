@@ -12,8 +12,13 @@ class PostOfficeConfig(AppConfig):
 
     def ready(self):
         from post_office import tasks
-        from post_office.settings import get_celery_enabled
+        from post_office.settings import get_celery_enabled, get_notify_channel
         from post_office.signals import email_queued
 
         if get_celery_enabled():
             email_queued.connect(tasks.queued_mail_handler)
+
+        if get_notify_channel():
+            from post_office.notify import notify_queued
+
+            email_queued.connect(notify_queued)
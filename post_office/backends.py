@@ -1,9 +1,135 @@
+import base64
+import re
+import smtplib
 from collections import OrderedDict
 from email.mime.base import MIMEBase
+from uuid import uuid4
+
+from django.conf import settings
 from django.core.files.base import ContentFile
 from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.backends.smtp import EmailBackend as DjangoSMTPEmailBackend
+from django.core.mail.message import sanitize_address
 from .settings import get_default_priority
 
+# A multiple of 57 bytes, which encode to exactly one 76 characters line of base64
+STREAM_CHUNK_SIZE = 57 * 1024
+
+
+class StreamedAttachment(MIMEBase):
+    """
+    A base64 encoded attachment, whose content is only read from storage in chunks while the message is
+    delivered by :class:`SMTPEmailBackend`. Until then its payload is a unique token marking its position.
+    """
+
+    def __init__(self, storage, path, filename, mimetype):
+        super().__init__(*mimetype.split('/', 1))
+        self.storage = storage
+        self.path = path
+        self.token = f'post-office-streamed-{uuid4().hex}'
+        self['Content-Transfer-Encoding'] = 'base64'
+        try:
+            filename.encode('ascii')
+        except UnicodeEncodeError:
+            filename = ('utf-8', '', filename)
+        self.add_header('Content-Disposition', 'attachment', filename=filename)
+        self.set_payload(self.token)
+
+    def iter_encoded(self):
+        with self.storage.open(self.path, 'rb') as file:
+            while chunk := file.read(STREAM_CHUNK_SIZE):
+                encoded = base64.b64encode(chunk)
+                yield b''.join(encoded[i:i + 76] + b'\r\n' for i in range(0, len(encoded), 76))
+
+
+def iter_message_bytes(message):
+    """
+    Yields the message in chunks, ready for the SMTP ``DATA`` command: lines end with CRLF, leading periods
+    are doubled, and the content of streamed attachments is encoded chunk by chunk.
+    """
+    streamed = {part.token.encode(): part for part in message.walk() if isinstance(part, StreamedAttachment)}
+    data = message.as_bytes(linesep='\r\n')
+    if not data.endswith(b'\r\n'):
+        data += b'\r\n'
+    if not streamed:
+        yield quote_periods(data)
+        return
+
+    pattern = re.compile(b'(' + b'|'.join(re.escape(token) for token in streamed) + b')\r\n')
+    segments = pattern.split(data)
+    for i, segment in enumerate(segments):
+        # split() puts the captured tokens at odd positions
+        if i % 2:
+            yield from streamed[segment].iter_encoded()
+        elif segment:
+            yield quote_periods(segment)
+
+
+def quote_periods(data):
+    return re.sub(br'(?m)^\.', b'..', data)
+
+
+class SMTPEmailBackend(DjangoSMTPEmailBackend):
+    """
+    Django's SMTP backend, which also delivers messages with attachments larger than
+    ``STREAMED_ATTACHMENT_SIZE``, without ever holding their content in memory.
+    """
+
+    supports_streamed_attachments = True
+
+    def _send(self, email_message):
+        if not email_message.recipients():
+            return False
+        encoding = email_message.encoding or settings.DEFAULT_CHARSET
+        from_email = sanitize_address(email_message.from_email, encoding)
+        recipients = [sanitize_address(addr, encoding) for addr in email_message.recipients()]
+        message = email_message.message()
+        try:
+            self.sendmail(from_email, recipients, iter_message_bytes(message))
+        except smtplib.SMTPException:
+            if not self.fail_silently:
+                raise
+            return False
+        return True
+
+    def sendmail(self, from_email, recipients, chunks):
+        """
+        Same as ``smtplib.SMTP.sendmail``, but writes the message chunk by chunk.
+        """
+        connection = self.connection
+        connection.ehlo_or_helo_if_needed()
+        code, response = connection.mail(from_email)
+        if code != 250:
+            connection.rset()
+            raise smtplib.SMTPSenderRefused(code, response, from_email)
+
+        refused = {}
+        for recipient in recipients:
+            code, response = connection.rcpt(recipient)
+            if code not in (250, 251):
+                refused[recipient] = (code, response)
+        if len(refused) == len(recipients):
+            connection.rset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+
+        code, response = connection.docmd('data')
+        if code != 354:
+            connection.rset()
+            raise smtplib.SMTPDataError(code, response)
+        try:
+            for chunk in chunks:
+                connection.send(chunk)
+        except Exception:
+            # The server is still waiting for the end of the message, so this connection can't be reused
+            self.close()
+            raise
+        connection.send(b'.\r\n')
+        code, response = connection.getreply()
+        if code != 250:
+            connection.rset()
+            raise smtplib.SMTPDataError(code, response)
+        return refused
+
 
 class EmailBackend(BaseEmailBackend):
     def open(self):
@@ -16,67 +142,108 @@ class EmailBackend(BaseEmailBackend):
         """
         Queue one or more EmailMessage objects and returns the number of
         email messages sent.
+
+        All messages are queued together: their addresses are resolved in one go and emails,
+        recipients and attachment links are bulk created in a single transaction.
         """
-        from .mail import create
-        from .models import STATUS, EmailModel
-        from .utils import create_attachments
+        from django.db import transaction
+        from email.utils import make_msgid
+
+        from .mail import dispatch_now, split_into_batches
+        from .models import PRIORITY, STATUS, EmailModel, Recipient
+        from .settings import get_default_language, get_message_id_enabled, get_message_id_fqdn
+        from .utils import create_attachments, get_recipients_objects, parse_priority, resolve_addresses
         from .signals import email_queued
 
         if not email_messages:
             return
 
-        default_priority = get_default_priority()
-        num_sent = 0
+        priority = parse_priority(get_default_priority())
+        status = None if priority == PRIORITY.now else STATUS.queued
+        language = get_default_language()
+        message_id_enabled = get_message_id_enabled()
+
+        all_addresses = [
+            address
+            for email_message in email_messages
+            for address in [*email_message.to, *email_message.cc, *email_message.bcc]
+        ]
+        addresses = resolve_addresses(all_addresses)
+
         emails = []
+        attachment_files = []
         for email_message in email_messages:
-            subject = email_message.subject
-            from_email = email_message.from_email
             headers = email_message.extra_headers
             if email_message.reply_to:
                 reply_to_header = ', '.join(str(v) for v in email_message.reply_to)
                 headers.setdefault('Reply-To', reply_to_header)
-            message = email_message.body  # The plaintext message is called body
             html_body = ''  # The default if no html body can be found
             if hasattr(email_message, 'alternatives') and len(email_message.alternatives) > 0:
                 for alternative in email_message.alternatives:
                     if alternative[1] == 'text/html':
                         html_body = alternative[0]
 
-            attachment_files = {}
-            for attachment in email_message.attachments:
-                if isinstance(attachment, MIMEBase):
-                    attachment_files[attachment.get_filename()] = {
-                        'file': ContentFile(attachment.get_payload()),
-                        'mimetype': attachment.get_content_type(),
-                        'headers': OrderedDict(attachment.items()),
-                    }
-                else:
-                    attachment_files[attachment[0]] = ContentFile(attachment[1])
-
-            email = create(
-                sender=from_email,
-                recipients=email_message.to,
-                cc=email_message.cc,
-                bcc=email_message.bcc,
-                subject=subject,
-                message=message,
+            context = {}
+            if email_message.to:
+                first_recipient = email_message.to[0]
+                context['recipient'] = addresses[first_recipient].id
+
+            email = EmailModel(
+                from_email=email_message.from_email,
+                subject=email_message.subject,
+                message=email_message.body,  # The plaintext message is called body
                 html_message=html_body,
                 headers=headers,
+                message_id=make_msgid(domain=get_message_id_fqdn()) if message_id_enabled else None,
+                priority=priority,
+                status=status,
+                context=context,
+                language=language,
             )
+            # bulk_create() bypasses save(), which would otherwise validate the email
+            email.full_clean()
+            emails.append(email)
+            attachment_files.append(self.get_attachment_files(email_message))
 
-            if attachment_files:
-                attachments = create_attachments(attachment_files)
+        with transaction.atomic():
+            emails = EmailModel.objects.bulk_create(emails)
 
-                email.attachments.add(*attachments)
+            recipients = []
+            for email, email_message in zip(emails, email_messages):
+                for send_type in ('to', 'cc', 'bcc'):
+                    recipients.extend(
+                        Recipient(email=email, address=address, send_type=send_type)
+                        for address in get_recipients_objects(getattr(email_message, send_type), addresses)
+                    )
+            Recipient.objects.bulk_create(recipients)
 
-            emails.append(email)
+            through_objs = []
+            for email, files in zip(emails, attachment_files):
+                if files:
+                    through_objs.extend(
+                        EmailModel.attachments.through(emailmodel_id=email.id, attachment_id=attachment.id)
+                        for attachment in create_attachments(files)
+                    )
+            if through_objs:
+                EmailModel.attachments.through.objects.bulk_create(through_objs)
 
-            if default_priority == 'now':
-                status = email.dispatch()
-                if status == STATUS.sent:
-                    num_sent += 1
+        if priority == PRIORITY.now:
+            return dispatch_now(emails)
 
-        if default_priority != 'now':
-            email_queued.send(sender=EmailModel, emails=emails)
+        for batch in split_into_batches(emails):
+            email_queued.send(sender=EmailModel, emails=batch)
+        return 0
 
-        return num_sent
+    @staticmethod
+    def get_attachment_files(email_message):
+        attachment_files = {}
+        for attachment in email_message.attachments:
+            if isinstance(attachment, MIMEBase):
+                attachment_files[attachment.get_filename()] = {
+                    'file': ContentFile(attachment.get_payload()),
+                    'mimetype': attachment.get_content_type(),
+                    'headers': OrderedDict(attachment.items()),
+                }
+            else:
+                attachment_files[attachment[0]] = ContentFile(attachment[1])
+        return attachment_files
@@ -7,20 +7,48 @@ from .settings import get_cache_backend
 cache_backend = get_cache_backend()
 
 
-def get_cache_key(name):
+def get_cache_key(name, version=None):
     """
-    Prefixes and slugify the key name
+    Prefixes and slugify the key name, optionally stamped with a version
     """
-    return 'post_office:template:%s' % (slugify(name))
+    key = 'post_office:template:%s' % (slugify(name))
+    if version is not None:
+        key = '%s:%s' % (key, version)
+    return key
 
 
-def set(name, content):
-    return cache_backend.set(get_cache_key(name), content)
+def get_version_key(name):
+    return 'post_office:version:%s' % (slugify(name))
 
 
-def get(name):
-    return cache_backend.get(get_cache_key(name))
+def set(name, content, version=None):
+    return cache_backend.set(get_cache_key(name, version), content)
 
 
-def delete(name):
-    return cache_backend.delete(get_cache_key(name))
+def get(name, version=None):
+    return cache_backend.get(get_cache_key(name, version))
+
+
+def delete(name, version=None):
+    return cache_backend.delete(get_cache_key(name, version))
+
+
+def get_version(name):
+    return cache_backend.get(get_version_key(name))
+
+
+def set_version(name, version):
+    """
+    Stamps ``name`` with ``version``, entries stored under other versions are no longer read.
+    Passing ``None`` removes the stamp.
+    """
+    if version is None:
+        return cache_backend.delete(get_version_key(name))
+    return cache_backend.set(get_version_key(name), version)
+
+
+def add_version(name, version):
+    """
+    Stamps ``name`` with ``version`` unless it already has a stamp, which may be newer.
+    """
+    return cache_backend.add(get_version_key(name), version)
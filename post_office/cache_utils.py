@@ -1,27 +1,158 @@
+import hashlib
+import time
+from collections import OrderedDict, namedtuple
+from threading import Lock
+
 from django.conf import settings
 from post_office import cache
+from post_office.settings import get_template_cache_timeout
+
+
+class LocalCache:
+    """
+    A bounded, process-local LRU mapping. Unlike the shared cache backend, values are neither
+    pickled nor sent over the network, so it may hold compiled templates and similar objects.
+
+    ``maxsize`` may be a callable, such as a settings getter, which is called whenever an entry is added.
+    With ``weigh``, it bounds the total weight of the entries, e.g. their size in bytes, instead of their number.
+    """
+
+    def __init__(self, maxsize=128, weigh=None):
+        self.maxsize = maxsize
+        self.weigh = weigh
+        self.hits = 0
+        self.misses = 0
+        self.weight = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, _ = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        maxsize = self.maxsize() if callable(self.maxsize) else self.maxsize
+        weight = self.weigh(value) if self.weigh else 1
+        with self._lock:
+            self._discard(key)
+            if weight <= maxsize:
+                self._data[key] = (value, weight)
+                self.weight += weight
+            while self.weight > maxsize:
+                self._discard(next(iter(self._data)))
+
+    def delete_matching(self, predicate):
+        """
+        Removes all entries whose key satisfies ``predicate``.
+        """
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+            self.hits = 0
+            self.misses = 0
+
+    def _discard(self, key):
+        if key in self._data:
+            self.weight -= self._data.pop(key)[1]
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Placeholder contents keyed by (template id, last_updated, language, base_file)
+placeholders_cache = LocalCache()
+# Email templates keyed by name
+templates_cache = LocalCache()
+CachedTemplate = namedtuple('CachedTemplate', 'template version checked')
+
+
+def get_version_stamp(last_updated):
+    return int(last_updated.timestamp() * 1000000)
+
+
+def get_cached_template(name, load):
+    """
+    Returns the email template called ``name``, calling ``load`` to fetch it from the database on a miss.
+
+    Templates are kept in the process and in the cache backend, the latter under keys stamped with the
+    template's version. A process trusts its own copy for ``TEMPLATE_CACHE_TIMEOUT`` seconds, then compares it
+    against the version stamp in the cache backend, which is bumped whenever the template or its contents change.
+    """
+    now = time.monotonic()
+    cached = templates_cache.get(name)
+    if cached is not None and now - cached.checked < get_template_cache_timeout():
+        return cached.template
+
+    version = cache.get_version(name)
+    if cached is not None and cached.version == version:
+        templates_cache.set(name, cached._replace(checked=now))
+        return cached.template
+
+    template = cache.get(name, version) if version is not None else None
+    if template is None:
+        template = load()
+        version = get_version_stamp(template.last_updated)
+        cache.set(name, template, version)
+        cache.add_version(name, version)
+    templates_cache.set(name, CachedTemplate(template, version, now))
+    return template
+
+
+def evict_cached_template(name, last_updated=None):
+    """
+    Drops the process copy of template ``name`` and stamps the cache backend with the version of
+    ``last_updated``, so that other processes reload it. Deleted templates pass no ``last_updated``.
+    """
+    templates_cache.delete_matching(lambda key: key == name)
+    cache.set_version(name, get_version_stamp(last_updated) if last_updated else None)
 
 
 def get_placeholders(template, language=''):
     """
-    Function that returns an email template instance, from cache or DB.
+    Returns the list of placeholder contents of ``template`` for ``language``.
+
+    Unless disabled by ``POST_OFFICE_CACHE`` or ``POST_OFFICE_PLACEHOLDERS_CACHE``, they are cached in the process
+    and in the cache backend. Keys are versioned by the template's ``last_updated``, which is bumped whenever one
+    of its placeholders changes, so that no process keeps using outdated contents.
     """
+    prefetched = getattr(template, '_prefetched_placeholders', None)
+    if prefetched is not None:
+        return prefetched.get((language, template.base_file), [])
+
     use_cache = getattr(settings, 'POST_OFFICE_CACHE', False)
     if use_cache:
         use_cache = getattr(settings, 'POST_OFFICE_PLACEHOLDERS_CACHE', True)
     if not use_cache:
-        return template.contents.filter(language=language,
-                                        base_file=template.base_file)
-    else:
-        composite_name = 'placeholders %s:%s:%s' % (template.name, language, template.base_file)
-        placeholders = cache.get(composite_name)
-        print(composite_name)
+        return list(template.contents.filter(language=language, base_file=template.base_file))
+
+    key = (template.id, template.last_updated, language, template.base_file)
+    placeholders = placeholders_cache.get(key)
+    if placeholders is None:
+        cache_name = 'placeholders %s %s %s %s' % (
+            template.id,
+            get_version_stamp(template.last_updated),
+            language,
+            hashlib.sha1(template.base_file.encode()).hexdigest(),
+        )
+        placeholders = cache.get(cache_name)
         if placeholders is None:
-            print('Placeholders from db')
-            placeholders = template.contents.filter(language=language,
-                                                    base_file=template.base_file)
-            cache.set(composite_name, list(placeholders))
-        else:
-            print('Placeholders from cache')
-
-        return placeholders
+            placeholders = list(template.contents.filter(language=language, base_file=template.base_file))
+            cache.set(cache_name, placeholders)
+        placeholders_cache.set(key, placeholders)
+    return placeholders
+
+
+def evict_placeholders(template_id):
+    placeholders_cache.delete_matching(lambda key: key[0] == template_id)
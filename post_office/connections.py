@@ -1,5 +1,8 @@
+import asyncio
+from contextlib import asynccontextmanager
 from threading import local
 
+from asgiref.sync import sync_to_async
 from django.core.mail import get_connection
 
 from .settings import get_backend
@@ -43,3 +46,61 @@ class ConnectionHandler:
 
 
 connections = ConnectionHandler()
+
+
+async def asend_messages(connection, email_messages):
+    """
+    Sends messages through ``connection``. Backends providing a coroutine ``asend_messages`` (for instance
+    wrappers around aiosmtplib) are awaited directly, blocking backends are run in a worker thread.
+    """
+    if hasattr(connection, 'asend_messages'):
+        return await connection.asend_messages(email_messages)
+    return await sync_to_async(connection.send_messages, thread_sensitive=False)(email_messages)
+
+
+class AsyncConnectionPool:
+    """
+    Hands out connections to coroutines running on the same event loop.
+
+    At most ``size`` connections are opened per backend alias, idle connections are reused.
+    """
+
+    def __init__(self, size=1):
+        self.size = max(size, 1)
+        self._idle = {}
+        self._semaphores = {}
+        self._opened = []
+
+    @asynccontextmanager
+    async def acquire(self, alias):
+        semaphore = self._semaphores.setdefault(alias, asyncio.Semaphore(self.size))
+        async with semaphore:
+            idle = self._idle.setdefault(alias, [])
+            connection = idle.pop() if idle else await self._open(alias)
+            try:
+                yield connection
+            finally:
+                idle.append(connection)
+
+    async def _open(self, alias):
+        try:
+            backend = get_backend(alias)
+        except KeyError:
+            raise KeyError('%s is not a valid backend alias' % alias)
+
+        connection = get_connection(backend)
+        if hasattr(connection, 'aopen'):
+            await connection.aopen()
+        else:
+            await sync_to_async(connection.open, thread_sensitive=False)()
+        self._opened.append(connection)
+        return connection
+
+    async def aclose(self):
+        for connection in self._opened:
+            if hasattr(connection, 'aclose'):
+                await connection.aclose()
+            else:
+                await sync_to_async(connection.close, thread_sensitive=False)()
+        self._opened = []
+        self._idle = {}
@@ -1,22 +1,38 @@
+import asyncio
+import copy
+import queue
+import time
+from collections import defaultdict
+from datetime import timedelta
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import connection as db_connection
-from django.db.models import Q
+from django.db.models import Case, Prefetch, Q, QuerySet, Value, When, prefetch_related_objects
 from django.utils import timezone
 from email.utils import make_msgid
+from uuid import uuid4
 
-from .connections import connections
+from .connections import AsyncConnectionPool, connections
 from .logutils import setup_loghandlers
-from .models import EmailModel, EmailMergeModel, Log, PRIORITY, STATUS, Recipient, EmailAddress
+from .models import (
+    EmailModel, EmailMergeModel, Log, PRIORITY, QUEUED_STATUSES, STATUS, Recipient, EmailAddress, PlaceholderContent
+)
 from .settings import (
     get_available_backends,
+    get_batch_delivery_timeout,
     get_batch_size,
+    get_async_connections, get_delivery_connections,
+    get_lease_duration,
     get_log_level,
     get_max_retries,
     get_message_id_enabled,
     get_message_id_fqdn,
     get_retry_timedelta,
-    get_sending_order, get_default_language
+    get_sending_order, get_default_language, get_send_many_chunk_size,
 )
 from .signals import email_queued
 from .utils import (
@@ -25,12 +41,17 @@ from .utils import (
     parse_emails,
     parse_priority,
     get_recipients_objects, set_recipients,
-    get_or_create_recipient, get_language_from_code,
+    get_address_key, get_language_from_code, resolve_addresses,
 )
 from django.db import transaction
 
 logger = setup_loghandlers('INFO')
 
+# Identifies the leases of this process, see ``claim_queued()``
+WORKER_ID = uuid4()
+
+FAILED_UPDATE_FIELDS = ['status', 'scheduled_time', 'number_of_retries', 'leased_by', 'leased_until', 'rendered']
+
 
 def create(
         sender,
@@ -69,21 +90,22 @@ def create(
     if context is None:
         context = {}
     message_id = make_msgid(domain=get_message_id_fqdn()) if get_message_id_enabled() else None
-    recipients_addresses = get_recipients_objects(recipients)
-    cc_addresses = get_recipients_objects(cc)
-    bcc_addresses = get_recipients_objects(bcc)
+    addresses = resolve_addresses([*recipients, *cc, *bcc])
+    recipients_addresses = get_recipients_objects(recipients, addresses)
+    cc_addresses = get_recipients_objects(cc, addresses)
+    bcc_addresses = get_recipients_objects(bcc, addresses)
 
     if commit and template:
         bcc_addresses.extend(list(template.extra_recipients.all()))
 
     if not (recipient := context.get('recipient', None)):  # If recipient is not set use the first one from the list
-        context['recipient'] = get_or_create_recipient(recipients[0]).id
+        context['recipient'] = addresses[get_address_key(recipients[0])].id
     else:
         if isinstance(recipient, EmailAddress):
             context['recipient'] = recipient.id
 
     if template:
-        translated_content = template.translated_contents.get(language=language)
+        translated_content = template.get_translated_content(language)
         subject = translated_content.subject
         message = translated_content.content
 
@@ -136,17 +158,17 @@ def send(
     try:
         recipients = parse_emails(recipients)
     except ValidationError as e:
-        raise ValidationError('recipients: %s' % e.message)
+        raise ValidationError('recipients: %s' % '; '.join(e.messages))
 
     try:
         cc = parse_emails(cc)
     except ValidationError as e:
-        raise ValidationError('c: %s' % e.message)
+        raise ValidationError('c: %s' % '; '.join(e.messages))
 
     try:
         bcc = parse_emails(bcc)
     except ValidationError as e:
-        raise ValidationError('bcc: %s' % e.message)
+        raise ValidationError('bcc: %s' % '; '.join(e.messages))
 
     if sender is None:
         sender = settings.DEFAULT_FROM_EMAIL
@@ -199,47 +221,109 @@ def send(
         email.attachments.add(*attachments)
 
     if template and commit:
-        extra_attachments = template.translated_contents.get(language=language).extra_attachments.all()
+        extra_attachments = template.get_translated_content(language).extra_attachments.all()
         email.attachments.add(*extra_attachments)
 
     if priority == PRIORITY.now:
-        email.dispatch(log_level=log_level)
+        dispatch_now([email], log_level=log_level)
     elif commit:
         email_queued.send(sender=EmailModel, emails=[email])
 
     return email
 
 
-def send_many(**kwargs):
+def send_many(chunk_size=None, return_emails=True, **kwargs):
     """
     This function allows to send multiple emails separately. Using it is beneficial if you need a user data as a
     context and you want to serve every recipient separately.
+
+    ``recipients`` may be any iterable of addresses or ``EmailAddress`` objects, including generators and querysets.
+    They are processed in chunks of ``chunk_size`` (defaults to ``SEND_MANY_CHUNK_SIZE``), each queued in its own
+    transaction and announced through ``email_queued`` as soon as it is committed. Lists and tuples are validated
+    and deduplicated as a whole before anything is queued, other iterables chunk by chunk.
+    With ``return_emails=False`` the number of queued emails is returned instead of the list of emails,
+    which keeps memory bounded for very large recipient lists.
     """
-    if not (recipients := parse_emails(kwargs.pop('recipients', None))):
-        raise ValueError('You must specify recipients')
+    recipients = kwargs.pop('recipients', None)
+    if recipients is None or isinstance(recipients, (str, list, tuple)):
+        if not (recipients := _unique_recipients(parse_emails(recipients))):
+            raise ValueError('You must specify recipients')
+        validate_chunks = False
+    else:
+        if isinstance(recipients, QuerySet):
+            recipients = recipients.iterator(chunk_size=chunk_size or get_send_many_chunk_size())
+        validate_chunks = True
     if kwargs.get('cc') or kwargs.get('bcc'):
         raise ValueError('send_many() can not be used with cc, bcc')
 
-    recipients_objs = get_recipients_objects(recipients)
+    fan_out = _FanOut(kwargs)
+    queued_emails = []
+    num_queued = 0
 
-    context = kwargs.pop('context', {})
-    if kwargs.get('language'):
-        emails = [
-            send(recipients=[recipient.email],
-                 context={**context, 'recipient': recipient.id},
-                 commit=False,
-                 **kwargs)
-            for recipient in recipients_objs]
-    else:
-        emails = [
-            send(recipients=[recipient.email],
-                 context={**context, 'recipient': recipient.id},
-                 commit=False,
-                 language=recipient.preferred_language,
-                 **kwargs)
-            for recipient in recipients_objs]
+    for chunk in _chunked(recipients, chunk_size or get_send_many_chunk_size()):
+        if validate_chunks:
+            parse_emails(chunk)
+        with transaction.atomic():
+            emails = fan_out.queue(get_recipients_objects(chunk))
+
+        for batch in split_into_batches(emails):
+            email_queued.send(sender=EmailModel, emails=batch)
+
+        num_queued += len(emails)
+        if return_emails:
+            queued_emails.extend(emails)
+
+    if not fan_out.started:
+        raise ValueError('You must specify recipients')
+
+    if not return_emails:
+        return num_queued
+    if queued_emails:
+        return queued_emails
+
+
+class _FanOut:
+    """
+    Creates the emails of a ``send_many()`` call, chunk by chunk.
+
+    Arguments, template and translated content are validated and resolved by send() once per language,
+    every further recipient of that language only gets a copy of the resulting email.
+    """
+
+    def __init__(self, kwargs):
+        self.context = kwargs.pop('context', {})
+        self.language = kwargs.pop('language', '')
+        self.attachments = kwargs.pop('attachments', None)
+        self.kwargs = kwargs
+        self.started = False
+        self.languages = {}
+        self.prototypes = {}
+        self.extra_attachments = {}
+        self.attach_objs = None
+
+    def queue(self, recipients_objs):
+        self.started = True
+        emails = []
+        for recipient in recipients_objs:
+            code = self.language or recipient.preferred_language
+            if code not in self.languages:
+                self.languages[code] = get_language_from_code(code)
+            email_language = self.languages[code]
+            recipient_context = {**self.context, 'recipient': recipient.id}
+
+            if email_language not in self.prototypes:
+                self.prototypes[email_language] = send(recipients=[recipient.email],
+                                                       context=recipient_context,
+                                                       commit=False,
+                                                       language=email_language,
+                                                       **self.kwargs)
+                emails.append(self.prototypes[email_language])
+            else:
+                emails.append(_copy_email(self.prototypes[email_language], context=recipient_context))
+
+        if not emails:
+            return emails
 
-    if emails:
         emails = EmailModel.objects.bulk_create(emails)
 
         email_recipients = []
@@ -247,34 +331,55 @@ def send_many(**kwargs):
             email_recipients.append(Recipient(email=email, address=recipient, send_type='to'))
         Recipient.objects.bulk_create(email_recipients)
 
-        if attachments := kwargs.get('attachments', None):
-            through_objs = []
-            attach_objs = create_attachments(attachments)
+        if self.attach_objs is None:
+            self.attach_objs = create_attachments(self.attachments) if self.attachments else []
 
-            if template := kwargs.get('template'):
-                if not isinstance(template, EmailMergeModel):
-                    template = get_email_template(template)
+        through_objs = []
+        for email in emails:
+            for attach in [*self.attach_objs, *self.get_extra_attachments(email.language)]:
+                through_objs.append(email.attachments.through(emailmodel_id=email.id, attachment_id=attach.id))
+        if through_objs:
+            EmailModel.attachments.through.objects.bulk_create(through_objs)
 
-            extra_attachments_cache = {}
+        return emails
 
-            for email, emailaddress in zip(emails, recipients_objs):
-                language = get_language_from_code(emailaddress.preferred_language, log=False)
+    def get_extra_attachments(self, language):
+        if language not in self.extra_attachments:
+            template = self.prototypes[language].template
+            if template:
+                translated_content = template.get_translated_content(language)
+                self.extra_attachments[language] = list(translated_content.extra_attachments.all())
+            else:
+                self.extra_attachments[language] = []
+        return self.extra_attachments[language]
 
-                if language not in extra_attachments_cache:
-                    extra_attachments = template.translated_contents.get(language=language).extra_attachments.all()
-                    extra_attachments_cache[language] = extra_attachments
-                else:
-                    extra_attachments = extra_attachments_cache[language]
 
-                for attach in [*attach_objs, *extra_attachments]:
-                    through_objs.append(email.attachments.through(emailmodel_id=email.id, attachment_id=attach.id))
+def _unique_recipients(recipients):
+    unique = {}
+    for recipient in recipients:
+        unique.setdefault(recipient.email if isinstance(recipient, EmailAddress) else recipient, recipient)
+    return list(unique.values())
 
-            emails[0].attachments.through.objects.bulk_create(through_objs)
 
-        for batch in split_into_batches(emails):
-            email_queued.send(sender=EmailModel, emails=batch)
+def _chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
 
-        return emails
+
+def _copy_email(email, **kwargs):
+    """
+    Returns an unsaved copy of an unsaved email with its own Message-ID, overriding the given fields.
+    Dicts and lists, such as the headers, are copied as well, so that changing them affects one email only.
+    """
+    fields = {}
+    for field in EmailModel._meta.concrete_fields:
+        if not field.primary_key:
+            value = getattr(email, field.attname)
+            fields[field.attname] = copy.copy(value) if isinstance(value, (dict, list)) else value
+    fields['message_id'] = make_msgid(domain=get_message_id_fqdn()) if email.message_id else None
+    fields.update(kwargs)
+    return EmailModel(**fields)
 
 
 def split_into_batches(emails):
@@ -288,69 +393,174 @@ def get_queued():
      - Status is queued or requeued
      - Has scheduled_time before the current time or is None
      - Has expires_at after the current time or is None
+     - Is not leased by a worker, or its lease has expired
     """
-    now = timezone.now()
-    query = (Q(scheduled_time__lte=now) | Q(scheduled_time=None)) & (Q(expires_at__gt=now) | Q(expires_at=None))
-    return (
-        EmailModel.objects.filter(query, status__in=[STATUS.queued, STATUS.requeued])
-        .select_related('template')
-        .order_by(*get_sending_order())
-        .prefetch_related('attachments')[: get_batch_size()]
+    return _for_sending(_get_eligible(timezone.now()).order_by(*get_sending_order()))[: get_batch_size()]
+
+
+def _get_eligible(now):
+    # Filtering on exactly QUEUED_STATUSES lets the database use the partial queue index, which is
+    # already sorted by priority, so only the few queued rows are scanned and no sort step is needed.
+    return EmailModel.objects.filter(status__in=QUEUED_STATUSES).filter(
+        Q(scheduled_time__lte=now) | Q(scheduled_time=None),
+        Q(expires_at__gt=now) | Q(expires_at=None),
+        Q(leased_until=None) | Q(leased_until__lte=now),
     )
 
 
-def _send_bulk(emails, uses_multiprocessing=True, log_level=None):
-    # Multiprocessing does not play well with database connection
-    # Fix: Close connections on forking process
-    # https://groups.google.com/forum/#!topic/django-users/eCAIY9DAfG0
-    if uses_multiprocessing:
-        db_connection.close()
+def claim_queued(worker_id=None, lease_duration=None):
+    """
+    Leases the next batch of queued emails to ``worker_id`` (defaults to an identifier of the running process)
+    for ``lease_duration`` (defaults to ``LEASE_DURATION``) and returns them, ready for sending.
 
-    if log_level is None:
-        log_level = get_log_level()
+    Rows are selected with ``SKIP LOCKED`` where the database supports it and are only locked during the claim,
+    so any number of workers can drain the queue in parallel. Emails whose lease has expired, for instance
+    because their worker died, are claimed again. Leases are released when the emails' status is updated.
+    """
+    return list(_for_sending(_claim(worker_id, lease_duration)))
 
-    sent_emails = []
-    failed_emails = []  # This is a list of two tuples (email, exception)
-    email_count = len(emails)
 
-    logger.info('Process started, sending %s emails' % email_count)
+def claim_queued_ids(worker_id=None, lease_duration=None):
+    """
+    Same as :func:`claim_queued`, but only returns the ids of the leased emails,
+    for handing them out to sending processes.
+    """
+    return list(_claim(worker_id, lease_duration).values_list('id', flat=True))
 
-    def send(email):
-        try:
-            email.dispatch(log_level=log_level, commit=False, disconnect_after_delivery=False)
-            sent_emails.append(email)
-            logger.debug('Successfully sent email #%d' % email.id)
-        except Exception as e:
-            logger.exception('Failed to send email #%d' % email.id)
-            failed_emails.append((email, e))
 
-    # Prepare emails before we send these to threads for sending
-    # So we don't need to access the DB from within threads
+def _claim(worker_id, lease_duration):
+    worker_id = worker_id or WORKER_ID
+    now = timezone.now()
+    leased_until = now + (lease_duration or get_lease_duration())
+
+    with transaction.atomic():
+        eligible = _get_eligible(now).order_by(*get_sending_order())
+        if db_connection.features.has_select_for_update_skip_locked:
+            eligible = eligible.select_for_update(skip_locked=True)
+        email_ids = list(eligible.values_list('id', flat=True)[: get_batch_size()])
+        # Checking eligibility again guards against concurrent claims on databases without SKIP LOCKED
+        _get_eligible(now).filter(id__in=email_ids).update(leased_by=worker_id, leased_until=leased_until)
+
+    return EmailModel.objects.filter(
+        id__in=email_ids, leased_by=worker_id, leased_until=leased_until
+    ).order_by(*get_sending_order())
+
+
+def _for_sending(queryset):
+    return queryset.select_related('template').prefetch_related('attachments', _get_recipients_prefetch())
+
+
+def _get_recipients_prefetch():
+    return Prefetch('recipient_set', queryset=Recipient.objects.select_related('address'))
+
+
+def prefetch_for_sending(emails):
+    """
+    Loads everything required to render a batch of emails in a constant number of queries:
+    recipients with their addresses, context recipients, templates, placeholders and attachments.
+    Emails sharing a template afterwards also share the same template instance.
+    """
+    emails = list(emails)
+    if not emails:
+        return emails
+
+    prefetch_related_objects(emails, 'template', 'attachments', _get_recipients_prefetch())
+
+    # A malformed context only fails its own email when rendering, not the whole batch
+    context_recipient_ids = {email.context.get('recipient') for email in emails if email.context}
+    context_recipient_ids.discard(None)
+    context_recipients = EmailAddress.objects.in_bulk(context_recipient_ids)
+
+    templates = {}
+    for email in emails:
+        if email.context:
+            email._context_recipient = context_recipients.get(email.context.get('recipient'))
+        if email.template_id:
+            email.template = templates.setdefault(email.template_id, email.template)
+
+    if templates:
+        placeholders = {template_id: defaultdict(list) for template_id in templates}
+        for placeholder in PlaceholderContent.objects.filter(emailmerge_id__in=templates):
+            placeholders[placeholder.emailmerge_id][(placeholder.language, placeholder.base_file)].append(placeholder)
+        for template_id, template in templates.items():
+            template._prefetched_placeholders = placeholders[template_id]
+
+    return emails
+
+
+def _deliver_concurrently(emails, send, num_connections):
+    """
+    Delivers already prepared emails using ``num_connections`` worker threads.
+
+    Since ``connections`` is thread-local, each worker keeps its own warm connection per backend
+    alias and pulls emails from a shared queue until it is drained. Throughput is logged per connection.
+    """
+    pending = queue.SimpleQueue()
+    for email in emails:
+        pending.put(email)
+
+    def worker(number):
+        delivered = 0
+        started = time.monotonic()
+        try:
+            while True:
+                try:
+                    email = pending.get_nowait()
+                except queue.Empty:
+                    break
+                # The message was prepared on the calling thread, rebind it to this thread's connection
+                email._cached_email_message.connection = connections[email.backend_alias or 'default']
+                send(email)
+                delivered += 1
+        finally:
+            connections.close()
+        elapsed = time.monotonic() - started
+        logger.info(
+            'Connection %d delivered %d emails in %.2fs (%.1f emails/s)',
+            number,
+            delivered,
+            elapsed,
+            delivered / elapsed if elapsed else 0,
+        )
+
+    with ThreadPoolExecutor(max_workers=num_connections, thread_name_prefix='post_office') as executor:
+        for future in [executor.submit(worker, number) for number in range(num_connections)]:
+            future.result()
+
+
+def _prepare_emails(emails, open_connections=True):
+    """
+    Renders the messages of all emails, so that they can be delivered without accessing the DB.
+    Returns a list of two tuples (email, exception) for emails which could not be prepared.
+    """
+    failed_emails = []
+    sanitized_values = {}
+    attachment_payloads = {}
+    prefetch_for_sending(emails)
     for email in emails:
         # Sometimes this can fail, for example when trying to render
         # email from a faulty Django template
         try:
-            email.prepare_email_message()
+            email.prepare_email_message(sanitized_values, attachment_payloads, open_connection=open_connections)
         except Exception as e:
             logger.exception('Failed to prepare email #%d' % email.id)
             failed_emails.append((email, e))
+    return failed_emails
 
-    for email in emails:
-        send(email)
-
-    connections.close()
-
-    # Update statuses of sent emails
-    email_ids = [email.id for email in sent_emails]
-    EmailModel.objects.filter(id__in=email_ids).update(status=STATUS.sent)
 
-    # Update statuses and conditionally requeue failed emails
+def _requeue_failed(failed_emails):
+    """
+    Sets the status of failed emails, requeueing those which have retries left.
+    Returns the list of modified emails, the number of failed and the number of requeued emails.
+    """
     num_failed, num_requeued = 0, 0
     max_retries = get_max_retries()
     scheduled_time = timezone.now() + get_retry_timedelta()
     emails_failed = [email for email, _ in failed_emails]
 
     for email in emails_failed:
+        email.leased_by = None
+        email.leased_until = None
         if email.number_of_retries is None:
             email.number_of_retries = 0
         if email.number_of_retries < max_retries:
@@ -362,12 +572,39 @@ def _send_bulk(emails, uses_multiprocessing=True, log_level=None):
             email.status = STATUS.failed
             num_failed += 1
 
-    EmailModel.objects.bulk_update(emails_failed, ['status', 'scheduled_time', 'number_of_retries'])
+    return emails_failed, num_failed, num_requeued
+
+
+def _get_send_deadline(emails):
+    """
+    Returns the time after which no more of the leased ``emails`` may be dispatched, or ``None`` if they are not
+    leased. Deliveries still in progress then have the rest of the lease to finish before other workers may claim
+    the emails again.
+    """
+    lease_ends = [email.leased_until for email in emails if email.leased_until]
+    if not lease_ends:
+        return None
+    margin = min(timedelta(seconds=get_batch_delivery_timeout()), get_lease_duration() / 2)
+    return min(lease_ends) - margin
+
 
+def _release(emails):
+    """
+    Gives up the lease of emails which were not dispatched, so that the next claim picks them up again.
+    """
+    if emails:
+        logger.warning('Lease about to expire, releasing %d unsent emails', len(emails))
+        EmailModel.objects.filter(id__in=[email.id for email in emails]).update(leased_by=None, leased_until=None)
+
+
+def _get_delivery_logs(sent_emails, failed_emails, log_level):
+    """
+    Returns the unsaved Log entries for a delivered batch.
+    """
     # If log level is 0, log nothing, 1 logs only sending failures
     # and 2 means log both successes and failures
+    logs = []
     if log_level >= 1:
-        logs = []
         for email, exception in failed_emails:
             logs.append(
                 Log(
@@ -378,17 +615,112 @@ def _send_bulk(emails, uses_multiprocessing=True, log_level=None):
                 )
             )
 
-        if logs:
-            Log.objects.bulk_create(logs)
-
     if log_level == 2:
-        logs = []
         for email in sent_emails:
             logs.append(Log(email=email, status=STATUS.sent))
 
-        if logs:
+    return logs
+
+
+def dispatch_now(emails, log_level=None):
+    """
+    Delivers ``emails`` right away, as done for ``PRIORITY.now``, and returns the number of sent emails.
+
+    All emails of a backend share one connection. Failed emails are not requeued. Their statuses are
+    written with a single UPDATE and their logs with a single INSERT, without validating the emails again.
+    """
+    if log_level is None:
+        log_level = get_log_level()
+
+    sent_emails = []
+    failed_emails = []
+    try:
+        for email in emails:
+            try:
+                email.dispatch(log_level=log_level, commit=False, disconnect_after_delivery=False)
+                email.status = STATUS.sent
+                sent_emails.append(email)
+            except Exception as e:
+                logger.exception('Failed to send email #%d' % email.id)
+                email.status = STATUS.failed
+                failed_emails.append((email, e))
+    finally:
+        connections.close()
+
+    sent_ids = [email.id for email in sent_emails]
+    failed_ids = [email.id for email, _ in failed_emails]
+    with transaction.atomic():
+        EmailModel.objects.filter(id__in=sent_ids + failed_ids).update(
+            status=Case(When(id__in=failed_ids, then=Value(STATUS.failed)), default=Value(STATUS.sent))
+        )
+        if logs := _get_delivery_logs(sent_emails, failed_emails, log_level):
             Log.objects.bulk_create(logs)
 
+    return len(sent_emails)
+
+
+def _send_bulk(emails, uses_multiprocessing=True, log_level=None, close_connections=True):
+    # Multiprocessing does not play well with database connection
+    # Fix: Close connections on forking process
+    # https://groups.google.com/forum/#!topic/django-users/eCAIY9DAfG0
+    if uses_multiprocessing:
+        db_connection.close()
+
+    if log_level is None:
+        log_level = get_log_level()
+
+    sent_emails = []
+    email_count = len(emails)
+
+    logger.info('Process started, sending %s emails' % email_count)
+
+    # Concurrent deliveries rebind the messages to the connections of their threads,
+    # so the connections of this thread are only opened if they are used
+    num_connections = min(get_delivery_connections(), len(emails))
+
+    # Prepare emails before we send these to threads for sending
+    # So we don't need to access the DB from within threads
+    # This is a list of two tuples (email, exception)
+    failed_emails = _prepare_emails(emails, open_connections=num_connections <= 1)
+    deadline = _get_send_deadline(emails)
+    unsent_emails = []
+
+    def send(email):
+        if deadline is not None and timezone.now() >= deadline:
+            unsent_emails.append(email)
+            return
+        try:
+            email.dispatch(log_level=log_level, commit=False, disconnect_after_delivery=False)
+            sent_emails.append(email)
+            logger.debug('Successfully sent email #%d' % email.id)
+        except Exception as e:
+            logger.exception('Failed to send email #%d' % email.id)
+            failed_emails.append((email, e))
+
+    prepared_emails = [email for email in emails if email._cached_email_message is not None]
+    if num_connections > 1 and prepared_emails:
+        _deliver_concurrently(prepared_emails, send, min(num_connections, len(prepared_emails)))
+    else:
+        for email in prepared_emails:
+            send(email)
+
+    # Long running workers keep their backend connections open for the next batch
+    if close_connections:
+        connections.close()
+
+    _release(unsent_emails)
+
+    # Update statuses of sent emails
+    email_ids = [email.id for email in sent_emails]
+    EmailModel.objects.filter(id__in=email_ids).update(status=STATUS.sent, leased_by=None, leased_until=None)
+
+    # Update statuses and conditionally requeue failed emails
+    emails_failed, num_failed, num_requeued = _requeue_failed(failed_emails)
+    EmailModel.objects.bulk_update(emails_failed, FAILED_UPDATE_FIELDS)
+
+    if logs := _get_delivery_logs(sent_emails, failed_emails, log_level):
+        Log.objects.bulk_create(logs)
+
     logger.info(
         'Process finished, %s attempted, %s sent, %s failed, %s requeued',
         email_count,
@@ -398,3 +730,76 @@ def _send_bulk(emails, uses_multiprocessing=True, log_level=None):
     )
 
     return len(sent_emails), num_failed, num_requeued
+
+
+def _send_bulk_ids(email_ids, log_level=None):
+    """
+    Loads the given (already claimed) emails and delivers them. This is the unit of work
+    handed to the processes of ``send_queued_mail``, so only ids have to be pickled.
+    """
+    emails = list(_for_sending(EmailModel.objects.filter(id__in=email_ids).order_by(*get_sending_order())))
+    return _send_bulk(emails, uses_multiprocessing=False, log_level=log_level)
+
+
+async def asend_bulk(emails, log_level=None, max_connections=None):
+    """
+    Asynchronous counterpart of ``_send_bulk``: delivers all emails concurrently on the running event loop,
+    using up to ``max_connections`` connections per backend alias (defaults to ``ASYNC_CONNECTIONS``).
+    Statuses and logs are updated through Django's async ORM.
+    """
+    if log_level is None:
+        log_level = get_log_level()
+    if max_connections is None:
+        max_connections = get_async_connections()
+
+    emails = list(emails)
+    sent_emails = []
+    email_count = len(emails)
+
+    logger.info('Event loop started, sending %s emails' % email_count)
+
+    # The messages are delivered through the pool's connections, not the thread-local ones
+    failed_emails = await sync_to_async(_prepare_emails)(emails, open_connections=False)
+    deadline = _get_send_deadline(emails)
+    unsent_emails = []
+
+    pool = AsyncConnectionPool(max_connections)
+
+    async def send(email):
+        try:
+            async with pool.acquire(email.backend_alias or 'default') as connection:
+                if deadline is not None and timezone.now() >= deadline:
+                    unsent_emails.append(email)
+                    return
+                await email.adispatch(log_level=log_level, connection=connection, commit=False)
+            sent_emails.append(email)
+            logger.debug('Successfully sent email #%d' % email.id)
+        except Exception as e:
+            logger.exception('Failed to send email #%d' % email.id)
+            failed_emails.append((email, e))
+
+    try:
+        await asyncio.gather(*[send(email) for email in emails if email._cached_email_message is not None])
+    finally:
+        await pool.aclose()
+
+    await sync_to_async(_release)(unsent_emails)
+
+    email_ids = [email.id for email in sent_emails]
+    await EmailModel.objects.filter(id__in=email_ids).aupdate(status=STATUS.sent, leased_by=None, leased_until=None)
+
+    emails_failed, num_failed, num_requeued = _requeue_failed(failed_emails)
+    await EmailModel.objects.abulk_update(emails_failed, FAILED_UPDATE_FIELDS)
+
+    if logs := _get_delivery_logs(sent_emails, failed_emails, log_level):
+        await Log.objects.abulk_create(logs)
+
+    logger.info(
+        'Event loop finished, %s attempted, %s sent, %s failed, %s requeued',
+        email_count,
+        len(sent_emails),
+        num_failed,
+        num_requeued,
+    )
+
+    return len(sent_emails), num_failed, num_requeued
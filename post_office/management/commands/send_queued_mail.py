@@ -1,16 +1,36 @@
+import signal
+import threading
+import time
+from functools import partial
 from multiprocessing import Pool
 
-from django.db import connection as db_connection
+from asgiref.sync import async_to_sync
+from django.db import close_old_connections, connection as db_connection, connections
 from django.core.management.base import BaseCommand
-from post_office.dblock import db_lock, TimeoutException, LockedException
-from post_office.mail import get_queued, _send_bulk
-from post_office.utils import split_emails
-from post_office.settings import get_batch_delivery_timeout
+from post_office.mail import asend_bulk, claim_queued, claim_queued_ids, get_queued, _send_bulk, _send_bulk_ids
+from post_office.notify import QueueListener
+from post_office.connections import connections as backend_connections
+from post_office.settings import get_batch_size, get_lease_duration
+
+
+def init_worker():
+    # Sending processes are stopped by their parent, not by the signals meant for the daemon
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
 
 
 class Command(BaseCommand):
     processes = 1
     log_level = 2
+    use_async = False
+    async_connections = None
+    pool = None
+    chunks_per_process = 4
+    daemon = False
+    listener = None
+    use_notifications = False
+    poll_interval = 1.0
+    max_poll_interval = 30.0
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -25,76 +45,216 @@ class Command(BaseCommand):
             type=int,
             help='"0" to log nothing, "1" to only log errors',
         )
+        parser.add_argument(
+            '-a', '--async',
+            action='store_true',
+            dest='use_async',
+            help='Deliver emails concurrently on an asyncio event loop instead of using processes',
+        )
+        parser.add_argument(
+            '-c', '--connections',
+            type=int,
+            help='Number of connections per backend used with --async, defaults to ASYNC_CONNECTIONS',
+        )
+        parser.add_argument(
+            '-d', '--daemon',
+            action='store_true',
+            help='Keep running and poll for queued emails until SIGTERM or SIGINT is received',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait before polling again after a partial batch (daemon mode)',
+        )
+        parser.add_argument(
+            '--max-poll-interval',
+            type=float,
+            default=30.0,
+            help='Upper limit in seconds for the interval between polls of an empty queue (daemon mode)',
+        )
 
     def handle(self, *args, **options):
         self.processes = options['processes']
         self.log_level = options.get('log_level')
-        self.send_queued_mail_until_done()
+        self.use_async = options.get('use_async', False)
+        self.async_connections = options.get('connections')
+        self.daemon = options.get('daemon', False)
+        self.poll_interval = options.get('poll_interval', 1.0)
+        self.max_poll_interval = max(options.get('max_poll_interval', 30.0), self.poll_interval)
+        if self.daemon:
+            self.run_daemon()
+        else:
+            self.send_queued_mail_until_done()
+
+    def run_daemon(self):
+        """
+        Sends queued emails until SIGTERM or SIGINT is received. A full batch is followed by the next one
+        right away, a partial batch by a pause of ``--poll-interval`` seconds, and every poll of an empty queue
+        doubles the pause up to ``--max-poll-interval`` seconds. On shutdown the current batch is finished first.
+
+        If ``NOTIFY_CHANNEL`` is set and the database is PostgreSQL, a pause ends as soon as emails are queued.
+        Should the listening connection fail, the daemon polls until it has reconnected.
+        """
+        self.stopping = threading.Event()
+        self.listener = QueueListener.create()
+        self.use_notifications = self.listener is not None
+        previous_handlers = {
+            signum: signal.signal(signum, self.request_stop) for signum in (signal.SIGTERM, signal.SIGINT)
+        }
+        if self.listener:
+            self.stdout.write('Sending queued emails until stopped, woken up by notifications.')
+        else:
+            self.stdout.write('Sending queued emails until stopped.')
+        interval = self.poll_interval
+        try:
+            while not self.stopping.is_set():
+                try:
+                    total_email = self.send_queued()[0]
+                except Exception as e:
+                    self.stderr.write(str(e))
+                    self.close_pool(terminate=True)
+                    total_email = 0
+
+                # Unlike a single run, the database connection is reused as long as it is healthy
+                close_old_connections()
+
+                if total_email >= get_batch_size():
+                    continue
+                if total_email:
+                    interval = self.poll_interval
+                else:
+                    # Idle backend connections would be dropped by the server anyway
+                    backend_connections.close()
+                    interval = min(interval * 2, self.max_poll_interval)
+                self.wait(interval)
+        finally:
+            self.close_pool()
+            self.close_listener()
+            backend_connections.close()
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+        self.stdout.write('Stopped sending queued emails.')
+
+    def wait(self, interval):
+        if self.listener is None and self.use_notifications:
+            try:
+                self.listener = QueueListener.create()
+            except Exception as e:
+                self.stderr.write(f'Could not listen for notifications: {e}')
+        if self.listener is None:
+            self.stopping.wait(interval)
+        elif not self.stopping.is_set():
+            try:
+                # Scheduled and requeued emails become due without a notification, hence the timeout
+                self.listener.wait(interval)
+            except Exception as e:
+                self.stderr.write(f'Lost the connection listening for notifications: {e}')
+                self.close_listener()
+                self.stopping.wait(interval)
+
+    def close_listener(self):
+        listener, self.listener = self.listener, None
+        if listener is not None:
+            try:
+                listener.close()
+            except Exception:
+                pass
+
+    def request_stop(self, signum, frame):
+        self.stdout.write('Finishing the current batch before stopping.')
+        self.stopping.set()
+        if self.listener:
+            self.listener.interrupt()
 
     def send_queued_mail_until_done(self):
+        """
+        Sends batches of queued emails until the queue is drained. Each batch is leased to this process,
+        so that several workers, even on different hosts, can run this command at the same time.
+        """
         try:
-            with db_lock('send_queued_mail_until_done'):
-                self.stdout.write('Acquired lock for sending queued email')
-                while True:
-                    try:
-                        self.send_queued()
-                    except Exception as e:
-                        self.stderr.write(str(e))
+            while True:
+                try:
+                    self.send_queued()
+                except Exception as e:
+                    self.stderr.write(str(e))
+                    # Workers may still be stuck on a timed out delivery, start over with fresh ones
+                    self.close_pool(terminate=True)
 
+                db_connection.close()
 
-                    db_connection.close()
+                if not get_queued().exists():
+                    break
+        finally:
+            self.close_pool()
 
-                    if not get_queued().exists():
-                        break
-        except TimeoutException:
-            self.stderr.write('Sending queued mail requires too long, terminating now.')
+    def get_pool(self):
+        """
+        Returns the pool of sending processes, which lives for the whole run of the command.
+        """
+        if self.pool is None:
+            # Forked processes must not share the parent's database connection
+            connections.close_all()
+            self.pool = Pool(processes=self.processes, initializer=init_worker)
+        return self.pool
 
-        except LockedException:
-            self.stderr.write('Failed to acquire lock, terminating now.')
+    def close_pool(self, terminate=False):
+        if self.pool is None:
+            return
+        if terminate:
+            self.pool.terminate()
+        else:
+            self.pool.close()
+        self.pool.join()
+        self.pool = None
 
     def send_queued(self):
-        queued_emails = get_queued()
         total_sent, total_failed, total_requeued = 0, 0, 0
-        total_email = len(queued_emails)
 
-        self.stdout.write(f"Starting sending {total_email} emails with {self.processes} processes.")
+        # Sending processes load the emails themselves, so only their ids are claimed for them
+        use_pool = not self.use_async and self.processes > 1
+        # Sending processes stop dispatching before the lease expires, waiting for them any longer is pointless
+        lease_end = time.monotonic() + get_lease_duration().total_seconds()
+        queued = claim_queued_ids() if use_pool else claim_queued()
+        total_email = len(queued)
 
-        if queued_emails:
+        if not total_email and self.daemon:
+            return total_email, total_sent, total_failed, total_requeued
 
-            if total_email < self.processes:
-                self.processes = total_email
+        if self.use_async:
+            self.stdout.write(f"Starting sending {total_email} emails on an event loop.")
+            if queued:
+                total_sent, total_failed, total_requeued = async_to_sync(asend_bulk)(
+                    queued, log_level=self.log_level, max_connections=self.async_connections,
+                )
 
-            if self.processes == 1:
-                total_sent, total_failed, total_requeued = _send_bulk(queued_emails,
+        elif not use_pool:
+            self.stdout.write(f"Starting sending {total_email} emails with 1 process.")
+            if queued:
+                total_sent, total_failed, total_requeued = _send_bulk(queued,
                                                                       uses_multiprocessing=False,
                                                                       log_level=self.log_level,
+                                                                      close_connections=not self.daemon,
                                                                       )
 
-            else:
-                email_lists = split_emails(queued_emails, self.processes)
-
-                pool: Pool = Pool(processes=self.processes)
-
-                tasks = []
-                for email_list in email_lists:
-                    tasks.append(pool.apply_async(_send_bulk, args=(email_list, True, self.log_level)))
-
-                timeout = get_batch_delivery_timeout()
-                results = []
-
-                for task in tasks:
-                    results.append(task.get(timeout=timeout))
-
-                pool.terminate()
-                pool.join()
+        else:
+            self.stdout.write(f"Starting sending {total_email} emails with {self.processes} processes.")
+            if queued:
+                # Hand out small chunks of ids, so that a process which is done pulls the next one
+                # instead of waiting for a process stuck on a slow server to finish a fixed share.
+                chunk_size = -(-total_email // (self.processes * self.chunks_per_process))
+                chunks = [queued[i:i + chunk_size] for i in range(0, total_email, chunk_size)]
+                results = self.get_pool().imap_unordered(partial(_send_bulk_ids, log_level=self.log_level), chunks)
 
-                total_sent = sum(result[0] for result in results)
-                total_failed = sum(result[1] for result in results)
-                total_requeued = [result[2] for result in results]
+                for _ in chunks:
+                    sent, failed, requeued = results.next(timeout=max(lease_end - time.monotonic(), 0))
+                    total_sent += sent
+                    total_failed += failed
+                    total_requeued += requeued
 
         self.stdout.write(f"{total_email} emails attempted, "
                           f"{total_sent} send, "
                           f"{total_failed} failed,"
                           f" {total_requeued} requeued.")
 
-        return total_sent, total_failed, total_requeued
+        return total_email, total_sent, total_failed, total_requeued
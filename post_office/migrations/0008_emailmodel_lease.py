@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-18 20:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post_office', '0007_alter_emailmergemodel_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailmodel',
+            name='leased_by',
+            field=models.UUIDField(blank=True, editable=False, null=True, verbose_name='Leased by'),
+        ),
+        migrations.AddField(
+            model_name='emailmodel',
+            name='leased_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Leased until'),
+        ),
+    ]
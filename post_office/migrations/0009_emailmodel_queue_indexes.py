@@ -0,0 +1,27 @@
+# Generated by Django 5.1 on 2026-10-18 20:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post_office', '0008_emailmodel_lease'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emailmodel',
+            index=models.Index(fields=['status', 'priority', 'scheduled_time'], name='post_office_email_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emailmodel',
+            index=models.Index(condition=models.Q(('status__in', [2, 3])), fields=['priority', 'scheduled_time', 'expires_at'], name='post_office_email_queue_idx'),
+        ),
+        # The single-column index on status is superseded by post_office_email_status_idx
+        migrations.AlterField(
+            model_name='emailmodel',
+            name='status',
+            field=models.PositiveSmallIntegerField(blank=True, choices=[(0, 'sent'), (1, 'failed'), (2, 'queued'), (3, 'requeued')], null=True, verbose_name='Status'),
+        ),
+    ]
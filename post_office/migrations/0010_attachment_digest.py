@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 20:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post_office', '0009_emailmodel_queue_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachment',
+            name='digest',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True, verbose_name='Digest'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 20:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post_office', '0010_attachment_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailmodel',
+            name='rendered',
+            field=models.JSONField(blank=True, editable=False, null=True, verbose_name='Rendered'),
+        ),
+    ]
@@ -1,22 +1,36 @@
+import hashlib
+import json
 import os
 from collections import namedtuple
 from typing import Union
 from uuid import uuid4
+from asgiref.sync import sync_to_async
+import mimetypes
+from email.mime.base import MIMEBase
 from email.mime.nonmultipart import MIMENonMultipart
 from django.core.exceptions import ValidationError
-from django.core.mail import EmailMessage, EmailMultiAlternatives
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.mail import EmailMessage, EmailMultiAlternatives, get_connection
+from django.core.mail.message import DEFAULT_ATTACHMENT_MIME_TYPE
 from django.db import models
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
 from django.utils.translation import pgettext_lazy, gettext_lazy as _
 from django.utils import timezone
 from ckeditor_uploader.fields import RichTextUploadingField
-from post_office import cache
-from .cache_utils import get_placeholders
+from .cache_utils import LocalCache, evict_cached_template, evict_placeholders, get_placeholders, get_version_stamp
 from django.conf import settings
-from .connections import connections
+from .backends import StreamedAttachment
+from .connections import AsyncConnectionPool, asend_messages, connections
 from .logutils import setup_loghandlers
 from .parser import process_template
-from .sanitizer import clean_html
-from .settings import get_log_level, get_template_engine, get_languages_list, get_attachments_storage
+from .sanitizer import clean_html, clean_html_many
+from .settings import (
+    get_attachment_cache_size, get_attachments_storage, get_backend, get_languages_list,
+    get_log_level,
+    get_render_cache_enabled, get_streamed_attachment_size, get_template_engine,
+)
+from .templatetags.post_office import get_inline_image
 from .validators import validate_email_with_name, validate_template_syntax
 from django.template import loader
 
@@ -24,6 +38,32 @@ logger = setup_loghandlers('INFO')
 
 PRIORITY = namedtuple('PRIORITY', 'low medium high now')._make(range(4))
 STATUS = namedtuple('STATUS', 'sent failed queued requeued')._make(range(4))
+# Statuses of emails waiting for delivery. The queue index is restricted to them,
+# so queries must filter on exactly this list for the index to apply.
+QUEUED_STATUSES = [STATUS.queued, STATUS.requeued]
+CompiledTemplate = namedtuple('CompiledTemplate', 'template placeholder_sources placeholder_templates')
+
+# Compiled templates keyed by (template id, last_updated, language, base_file)
+compiled_templates = LocalCache()
+
+
+def get_mime_attachment_size(mime_attachment):
+    # Either a (name, content, mimetype) tuple or a MIME part, see ``Attachment.get_mime_attachment()``
+    if isinstance(mime_attachment, tuple):
+        return len(mime_attachment[1])
+    return len(mime_attachment.get_payload())
+
+
+# Attachment payloads and MIME parts keyed by (attachment id, file name, stream), bounded by their size in bytes
+mime_attachments = LocalCache(get_attachment_cache_size, weigh=get_mime_attachment_size)
+
+
+def get_base_file_digest(base_file):
+    """
+    Returns a digest of the source of ``base_file``, as loaded by the post_office template engine.
+    """
+    source = loader.get_template(base_file, using='post_office').template.source
+    return hashlib.sha1(source.encode()).hexdigest()
 
 
 class Recipient(models.Model):
@@ -78,23 +118,65 @@ class EmailAddress(models.Model):
         app_label = 'post_office'
 
 
-def render_message(html_str, context):
+def render_message(html_str, context, sanitized_values=None):
     """
     Replaces variables of format #var# with actual values from the context.
     Fills recipient data into added placeholders.
+
+    The text is scanned once and only the values of variables found in it are sanitized.
+    Pass the same ``sanitized_values`` dict when rendering a batch, to sanitize each distinct value only once.
     """
-    for placeholder, value in context.items():
-        placeholder_notation = f"#{placeholder}#"
-        html_str = html_str.replace(placeholder_notation, clean_html(str(value)))
+    if '#' not in html_str:
+        return html_str
+    if sanitized_values is None:
+        sanitized_values = {}
+
+    recipient = context.get('recipient', None)
+    recipient_fields = get_concrete_field_names(recipient) if hasattr(recipient, '_meta') else ()
+
+    def lookup(name):
+        if name in context:
+            value = context[name]
+        elif name.startswith('recipient.') and name[10:] in recipient_fields:
+            value = getattr(recipient, name[10:], '')
+        else:
+            return None
+        value = str(value)
+        try:
+            return sanitized_values[value]
+        except KeyError:
+            sanitized = sanitized_values[value] = clean_html(value)
+            return sanitized
+
+    parts = []
+    position = 0
+    while (start := html_str.find('#', position)) >= 0 and (end := html_str.find('#', start + 1)) >= 0:
+        value = lookup(html_str[start + 1:end])
+        if value is None:
+            # Not a variable, the closing "#" may still open the next one
+            parts.append(html_str[position:end])
+            position = end
+        else:
+            parts.append(html_str[position:start])
+            parts.append(value)
+            position = end + 1
+    parts.append(html_str[position:])
+
+    return ''.join(parts)
 
-    if recipient := context.get('recipient', None):
-        for field in recipient._meta.get_fields():
-            if field.concrete:
-                placeholder_notation = f"#recipient.{field.name}#"
-                value = getattr(recipient, field.name, "")
-                html_str = html_str.replace(placeholder_notation, clean_html(str(value)))
 
-    return html_str
+_concrete_field_names = {}
+
+
+def get_concrete_field_names(instance):
+    model = type(instance)
+    try:
+        return _concrete_field_names[model]
+    except KeyError:
+        names = _concrete_field_names[model] = frozenset(
+            field.name for field in instance._meta.get_fields() if field.concrete
+        )
+        return names
 
 
 class EmailModel(models.Model):
@@ -125,7 +207,7 @@ class EmailModel(models.Model):
     Status field will then be set to ``failed`` or ``sent`` depending on
     whether it's successfully delivered.
     """
-    status = models.PositiveSmallIntegerField(_('Status'), choices=STATUS_CHOICES, db_index=True, blank=True, null=True)
+    status = models.PositiveSmallIntegerField(_('Status'), choices=STATUS_CHOICES, blank=True, null=True)
     priority = models.PositiveSmallIntegerField(_('Priority'), choices=PRIORITY_CHOICES, blank=True, null=True)
     created = models.DateTimeField(auto_now_add=True, db_index=True)
     last_updated = models.DateTimeField(db_index=True, auto_now=True)
@@ -144,15 +226,35 @@ class EmailModel(models.Model):
     language = models.CharField(max_length=12)
     context = models.JSONField(_('Context'), blank=True, null=True)
     backend_alias = models.CharField(_('Backend alias'), blank=True, default='', max_length=64)
+    """
+    Workers claim batches of queued emails by leasing them until ``leased_until``.
+    Emails with an expired lease are claimed again by the next worker.
+    """
+    leased_by = models.UUIDField(_('Leased by'), blank=True, null=True, editable=False)
+    leased_until = models.DateTimeField(_('Leased until'), blank=True, null=True, editable=False)
+    # Rendered subject and bodies, stored when ``RENDER_CACHE_ENABLED`` is set, see ``prepare_email_message()``
+    rendered = models.JSONField(_('Rendered'), blank=True, null=True, editable=False)
 
     class Meta:
         app_label = 'post_office'
         verbose_name = pgettext_lazy('Email address', 'Email')
         verbose_name_plural = pgettext_lazy('Email addresses', 'Emails')
+        indexes = [
+            # Also serves plain lookups by status, and the queue on databases without partial indexes
+            models.Index(fields=['status', 'priority', 'scheduled_time'], name='post_office_email_status_idx'),
+            # Only holds emails waiting for delivery, so it stays small however many emails have been sent
+            models.Index(
+                fields=['priority', 'scheduled_time', 'expires_at'],
+                name='post_office_email_queue_idx',
+                condition=models.Q(status__in=QUEUED_STATUSES),
+            ),
+        ]
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._cached_email_message = None
+        self._context_recipient = None
+        self._rendered_changed = False
 
     def __str__(self):
         return str([str(recipient) for recipient in self.recipients.all()])
@@ -163,11 +265,23 @@ class EmailModel(models.Model):
                            headers,
                            subject,
                            connection,
-                           multipart_template) \
+                           multipart_template,
+                           template_rendered=False,
+                           images=None) \
             -> Union[EmailMessage, EmailMultiAlternatives]:
-        to_list = [str(to) for to in self.recipients.through.objects.filter(email=self, send_type='to')]
-        cc_list = [str(cc) for cc in self.recipients.through.objects.filter(email=self, send_type='cc')]
-        bcc_list = [str(bcc) for bcc in self.recipients.through.objects.filter(email=self, send_type='bcc')]
+        """
+        Builds the message object. Unless ``template_rendered`` is set, ``multipart_template``
+        is rendered to obtain the HTML body, otherwise only its inline images are attached.
+        ``images`` are inline images of an HTML body rendered beforehand.
+        """
+        if 'recipient_set' in getattr(self, '_prefetched_objects_cache', {}):
+            recipients = self.recipient_set.all()
+        else:
+            recipients = self.recipient_set.select_related('address')
+        to_list, cc_list, bcc_list = [], [], []
+        send_type_lists = {'to': to_list, 'cc': cc_list, 'bcc': bcc_list}
+        for recipient in recipients:
+            send_type_lists[recipient.send_type].append(str(recipient))
         common_args = {
             'subject': subject,
             'from_email': self.from_email,
@@ -181,8 +295,8 @@ class EmailModel(models.Model):
 
             msg = EmailMultiAlternatives(body=plaintext_message or html_message, **common_args)
 
-            if multipart_template:
-                html_message = multipart_template.render({'dry_run': False})
+            if multipart_template and not template_rendered:
+                html_message, images = multipart_template.render_with_images({'dry_run': False})
                 msg.body = plaintext_message or html_message
             if plaintext_message:
                 msg.attach_alternative(html_message, 'text/html')
@@ -190,7 +304,11 @@ class EmailModel(models.Model):
                 msg.content_subtype = 'html'
 
             if multipart_template:
-                multipart_template.attach_related(msg)
+                multipart_template.attach_related(msg, images)
+            elif images:
+                msg.mixed_subtype = 'related'
+                for image in images:
+                    msg.attach(image)
         else:
             msg = EmailMessage(body=plaintext_message, **common_args)
 
@@ -203,40 +321,117 @@ class EmailModel(models.Model):
         if self._cached_email_message:
             return self._cached_email_message
 
-        return self.prepare_email_message()
+        msg = self.prepare_email_message()
+        if self._rendered_changed and self.pk:
+            EmailModel.objects.filter(pk=self.pk).update(rendered=self.rendered)
+            self._rendered_changed = False
+        return msg
 
-    def prepare_email_message(self):
+    def get_render_key(self):
         """
-        Returns a django ``EmailMessage`` or ``EmailMultiAlternatives`` object,
-        depending on whether html_message is empty.
+        Identifies the contents which the email is rendered from: its own fields, the fields of the context
+        recipient, and the version and base file of the template. Stored renderings of other contents are ignored.
+        """
+        recipient = self.get_context_recipient()
+        recipient_values = [getattr(recipient, field.attname) for field in recipient._meta.concrete_fields] \
+            if recipient is not None else None
+        template = [
+            self.template_id,
+            get_version_stamp(self.template.last_updated),
+            self.template.base_file,
+            get_base_file_digest(self.template.base_file),
+        ] if self.template_id else None
+        data = [self.subject, self.message, self.html_message, self.context, self.language, recipient_values, template]
+        return hashlib.sha1(json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True).encode()).hexdigest()
+
+    def get_context_recipient(self):
+        """
+        Returns the ``EmailAddress`` whose id the context holds as ``recipient``, or ``None`` without a context.
+        """
+        if not self.context:
+            return None
+        recipient = self._context_recipient
+        if recipient is None or recipient.id != self.context['recipient']:
+            recipient = self._context_recipient = EmailAddress.objects.get(id=self.context['recipient'])
+        return recipient
+
+    def get_rendered(self):
+        """
+        Returns the stored subject, bodies and inline images of the email if they are up to date, otherwise ``None``.
+        """
+        if not self.rendered or self.rendered['key'] != self.get_render_key():
+            return None
+        images = [get_inline_image(path) for path in self.rendered['images']]
+        # Replaced images get other Content-IDs than those referenced by the stored HTML
+        if None in images or [image['Content-ID'] for image in images] != self.rendered.get('content_ids'):
+            return None
+        return self.rendered['subject'], self.rendered['message'], self.rendered['html_message'], images
+
+    def render_parts(self, sanitized_values):
+        """
+        Returns the rendered subject, plain text and HTML bodies and the inline images of the HTML body.
         """
         # if get_override_recipients():
         #     self.to = get_override_recipients()
 
         # Replace recipient id with EmailAddress object
         if self.context:
-            context = {**self.context}
-            context['recipient'] = EmailAddress.objects.get(id=self.context['recipient'])
+            context = {**self.context, 'recipient': self.get_context_recipient()}
         else:
             context = {}
 
-        subject = render_message(self.subject, context)
-        plaintext_message = render_message(self.message, context)
+        subject = render_message(self.subject, context, sanitized_values)
+        plaintext_message = render_message(self.message, context, sanitized_values)
 
         if self.template is not None and self.context is not None:
-            html_message = self.template.render_email_template(recipient=context['recipient'],
-                                                               language=self.language,
-                                                               context_dict=context)
-            html_message = render_message(html_message, context)
-
-            engine = get_template_engine()
-            multipart_template = engine.from_string(html_message)
+            compiled_template = self.template.get_compiled_template(self.language)
+            html_message, images = compiled_template.template.render_with_images({
+                **context,
+                'dry_run': False,
+                'placeholder_contents': compiled_template.placeholder_templates,
+            })
+            html_message = render_message(html_message, context, sanitized_values)
 
         else:
-            multipart_template = None
-            html_message = render_message(self.html_message, context)
+            images = []
+            html_message = render_message(self.html_message, context, sanitized_values)
 
-        connection = connections[self.backend_alias or 'default']
+        return subject, plaintext_message, html_message, images
+
+    def prepare_email_message(self, sanitized_values=None, attachment_payloads=None, open_connection=True):
+        """
+        Returns a django ``EmailMessage`` or ``EmailMultiAlternatives`` object,
+        depending on whether html_message is empty.
+        ``sanitized_values`` and ``attachment_payloads`` may be shared between the emails of a batch,
+        see ``render_message`` and ``Attachment.get_mime_attachment``.
+        Without ``open_connection``, the message is bound to a backend connection which is not opened yet,
+        for deliveries passing it to a connection of their own.
+        """
+        if sanitized_values is None:
+            sanitized_values = {}
+        render_cache_enabled = get_render_cache_enabled()
+        rendered = self.get_rendered() if render_cache_enabled else None
+
+        if rendered is not None:
+            subject, plaintext_message, html_message, images = rendered
+        else:
+            subject, plaintext_message, html_message, images = self.render_parts(sanitized_values)
+            if render_cache_enabled:
+                paths = [getattr(image, 'storage_path', None) for image in images]
+                # Images read from file objects can not be loaded again
+                if None not in paths:
+                    self.rendered = {
+                        'key': self.get_render_key(),
+                        'subject': subject,
+                        'message': plaintext_message,
+                        'html_message': html_message,
+                        'images': paths,
+                        'content_ids': [image['Content-ID'] for image in images],
+                    }
+                    self._rendered_changed = True
+
+        alias = self.backend_alias or 'default'
+        connection = connections[alias] if open_connection else get_connection(get_backend(alias))
         if isinstance(self.headers, dict) or self.expires_at or self.message_id:
             headers = dict(self.headers or {})
             if self.expires_at:
@@ -251,22 +446,16 @@ class EmailModel(models.Model):
                                       headers=headers,
                                       subject=subject,
                                       connection=connection,
-                                      multipart_template=multipart_template)
+                                      multipart_template=None,
+                                      images=images)
 
+        stream = getattr(connection, 'supports_streamed_attachments', False)
         for attachment in self.attachments.all():
-            attachment.file.open('rb')
-            if attachment.headers:
-                mime_part = MIMENonMultipart(*attachment.mimetype.split('/'))
-                mime_part.set_payload(attachment.file.read())
-                for key, val in attachment.headers.items():
-                    try:
-                        mime_part.replace_header(key, val)
-                    except KeyError:
-                        mime_part.add_header(key, val)
-                msg.attach(mime_part)
+            mime_attachment = attachment.get_mime_attachment(attachment_payloads, stream=stream)
+            if isinstance(mime_attachment, MIMEBase):
+                msg.attach(mime_attachment)
             else:
-                msg.attach(attachment.name, attachment.file.read(), mimetype=attachment.mimetype or None)
-            attachment.file.close()
+                msg.attach(*mime_attachment)
 
         self._cached_email_message = msg
         return msg
@@ -296,7 +485,7 @@ class EmailModel(models.Model):
 
         if commit:
             self.status = status
-            self.save(update_fields=['status'])
+            self.save(update_fields=['status'], validate=False)
 
             if log_level is None:
                 log_level = get_log_level()
@@ -311,14 +500,68 @@ class EmailModel(models.Model):
 
         return status
 
+    async def adispatch(self, log_level=None, connection=None, commit=True):
+        """
+        Asynchronous counterpart of ``dispatch``. If no ``connection`` is given, a new one
+        is opened for this delivery only.
+        """
+        email_message = self._cached_email_message or \
+            await sync_to_async(self.prepare_email_message)(open_connection=False)
+        try:
+            if connection is None:
+                pool = AsyncConnectionPool()
+                try:
+                    async with pool.acquire(self.backend_alias or 'default') as pool_connection:
+                        await asend_messages(pool_connection, [email_message])
+                finally:
+                    await pool.aclose()
+            else:
+                await asend_messages(connection, [email_message])
+            status = STATUS.sent
+            message = ''
+            exception_type = ''
+        except Exception as e:
+            status = STATUS.failed
+            message = str(e)
+            exception_type = type(e).__name__
+            if commit:
+                logger.exception('Failed to send email')
+            else:
+                # If run in a bulk sending mode, re-raise and let the outer
+                # layer handle the exception
+                raise
+
+        if commit:
+            self.status = status
+            await self.asave(update_fields=['status'], validate=False)
+
+            if log_level is None:
+                log_level = get_log_level()
+
+            if log_level == 1:
+                if status == STATUS.failed:
+                    await self.logs.acreate(status=status, message=message, exception_type=exception_type)
+            elif log_level == 2:
+                await self.logs.acreate(status=status, message=message, exception_type=exception_type)
+
+        return status
+
     def clean(self):
         if self.scheduled_time and self.expires_at and self.scheduled_time > self.expires_at:
             raise ValidationError(_('The scheduled time may not be later than the expires time.'))
 
-    def save(self, *args, **kwargs):
-        self.full_clean()
+    def save(self, *args, validate=True, **kwargs):
+        """
+        Validates the email before saving it. Internal updates of emails which were validated
+        when created, such as status changes after delivery, pass ``validate=False``.
+        """
+        if validate:
+            self.full_clean()
         return super().save(*args, **kwargs)
 
+    async def asave(self, *args, validate=True, **kwargs):
+        return await sync_to_async(self.save)(*args, validate=validate, **kwargs)
+
 
 class Log(models.Model):
     """
@@ -378,37 +621,70 @@ class EmailMergeModel(models.Model):
         if not context_dict:
             context_dict = {}
 
-        engine = get_template_engine()
+        compiled_template = self.get_compiled_template(language)
         context = {'recipient': recipient, 'dry_run': True, **context_dict} \
             if recipient else {'dry_run': True, **context_dict}
 
-        django_template_first_pass = loader.get_template(self.base_file, using='post_office')
-
-        # Replace all {% placeholder <name> %} to {{ name }}
-        first_pass_content = django_template_first_pass.render(context)
-
-        placeholders = get_placeholders(self, language=language)
-        context_data = {placeholder.placeholder_name: clean_html(placeholder.content) for placeholder in placeholders}
-        context_data = {**context_data, 'dry_run': True}
-
-        # Replaces placeholders with actual values
-        django_template_second_pass = engine.from_string("{% load post_office %}" + first_pass_content)
-        final_content = django_template_second_pass.render(context_data)
+        # Fills {% placeholder <name> %} with the sanitized placeholder contents
+        context['placeholder_contents'] = compiled_template.placeholder_sources
+        final_content = compiled_template.template.render(context)
 
         final_content = f"{{% load post_office %}}\n {final_content}"
 
         return final_content
 
+    def get_compiled_template(self, language):
+        """
+        Returns the compiled base file and placeholder contents for the given language.
+        They are cached per process until the template or one of its placeholders is saved.
+        """
+        key = (self.id, self.last_updated, language, self.base_file)
+        compiled_template = compiled_templates.get(key)
+        if compiled_template is None:
+            engine = get_template_engine()
+            placeholders = list(get_placeholders(self, language=language))
+            placeholder_sources = dict(zip(
+                [placeholder.placeholder_name for placeholder in placeholders],
+                clean_html_many([placeholder.content for placeholder in placeholders]),
+            ))
+            placeholder_templates = {
+                name: engine.from_string('{% load post_office %}' + source).template
+                for name, source in placeholder_sources.items()
+            }
+            compiled_template = CompiledTemplate(
+                template=loader.get_template(self.base_file, using='post_office'),
+                placeholder_sources=placeholder_sources,
+                placeholder_templates=placeholder_templates,
+            )
+            compiled_templates.set(key, compiled_template)
+        return compiled_template
+
+    def get_translated_content(self, language):
+        """
+        Returns the content for ``language``, without a query if the contents were prefetched.
+        """
+        prefetched = getattr(self, '_prefetched_objects_cache', {}).get('translated_contents')
+        if prefetched is None:
+            return self.translated_contents.get(language=language)
+        for translated_content in prefetched:
+            if translated_content.language == language:
+                return translated_content
+        raise EmailMergeContentModel.DoesNotExist(
+            f'{self.name} has no content for language {language!r}'
+        )
+
     def save(self, *args, **kwargs):
         template = super().save(*args, **kwargs)
-        cache.delete(self.name)
+        evict_template(self.id, self.name, self.last_updated)
         existing_languages = set(self.translated_contents.values_list('language', flat=True))
-        for lang in set(get_languages_list()) - existing_languages:
-            EmailMergeContentModel.objects.create(subject=f'Subject, language: {lang}',
-                                                  content=f'Content, language: {lang}',
-                                                  emailmerge=self,
-                                                  language=lang
-                                                  )
+        content_objs = [
+            EmailMergeContentModel(subject=f'Subject, language: {lang}',
+                                   content=f'Content, language: {lang}',
+                                   emailmerge=self,
+                                   language=lang
+                                   )
+            for lang in set(get_languages_list()) - existing_languages
+        ]
 
         placeholder_names = process_template(self.base_file)
 
@@ -426,7 +702,13 @@ class EmailMergeModel(models.Model):
                                                                content=f"Placeholder: {placeholder_name}, "
                                                                        f"Language: {lang}", ), )
 
-        PlaceholderContent.objects.bulk_create(placeholder_objs)
+        # bulk_create() does not send post_save
+        if content_objs:
+            EmailMergeContentModel.objects.bulk_create(content_objs)
+        if placeholder_objs:
+            PlaceholderContent.objects.bulk_create(placeholder_objs)
+        if content_objs or placeholder_objs:
+            self.last_updated = touch_template(self.id)
 
         return template
 
@@ -483,6 +765,11 @@ class Attachment(models.Model):
     emails = models.ManyToManyField(EmailModel, related_name='attachments', verbose_name=_('Emails'), blank=True)
     mimetype = models.CharField(max_length=255, default='', blank=True)
     headers = models.JSONField(_('Headers'), blank=True, null=True)
+    """
+    SHA-256 of the content, name, mimetype and headers, so that identical attachments are stored once
+    and shared by all emails using them. Empty for attachments uploaded through the admin.
+    """
+    digest = models.CharField(_('Digest'), max_length=64, unique=True, blank=True, null=True, editable=False)
 
     class Meta:
         app_label = 'post_office'
@@ -492,6 +779,47 @@ class Attachment(models.Model):
     def __str__(self):
         return self.name
 
+    def get_mime_attachment(self, payloads=None, stream=False):
+        """
+        Returns the attachment as accepted by ``EmailMessage.attach``: a ``MIMENonMultipart`` part if it has
+        headers, otherwise a ``(name, content, mimetype)`` tuple. The file is read from storage only once per
+        batch, if the batch shares a ``payloads`` dict, and once per process while it stays in
+        ``mime_attachments`` (see ``ATTACHMENT_CACHE_SIZE``).
+
+        With ``stream``, binary files larger than ``STREAMED_ATTACHMENT_SIZE`` are returned as
+        ``StreamedAttachment`` instead, which is only read while being delivered.
+        """
+        key = (self.id, self.file.name, stream)
+        if payloads is not None and key in payloads:
+            return payloads[key]
+        mime_attachment = mime_attachments.get(key)
+        if mime_attachment is None:
+            mime_attachment = self._build_mime_attachment(stream)
+            mime_attachments.set(key, mime_attachment)
+        if payloads is not None:
+            payloads[key] = mime_attachment
+        return mime_attachment
+
+    def _build_mime_attachment(self, stream=False):
+        if stream and not self.headers:
+            mimetype = self.mimetype or mimetypes.guess_type(self.name)[0] or DEFAULT_ATTACHMENT_MIME_TYPE
+            # Text and message parts are not base64 encoded by Django, keep them as they are
+            if mimetype.split('/')[0] not in ('text', 'message') and self.file.size > get_streamed_attachment_size():
+                return StreamedAttachment(self.file.storage, self.file.name, self.name, mimetype)
+
+        with self.file.open('rb') as file:
+            content = file.read()
+        if not self.headers:
+            return self.name, content, self.mimetype or None
+        mime_part = MIMENonMultipart(*self.mimetype.split('/'))
+        mime_part.set_payload(content)
+        for key, val in self.headers.items():
+            try:
+                mime_part.replace_header(key, val)
+            except KeyError:
+                mime_part.add_header(key, val)
+        return mime_part
+
 
 class DBMutex(models.Model):
     lock_id = models.CharField(
@@ -536,6 +864,54 @@ class PlaceholderContent(models.Model):
                                     name='unique_placeholder'),
         ]
 
-    def save(self, *args, **kwargs):
-        cache.delete('placeholders %s:%s:%s' % (self.emailmerge.name, self.language, self.base_file))
-        return super().save(*args, **kwargs)
+
+
+def touch_template(template_id):
+    """
+    Bumps ``last_updated`` of the template, which versions all cached data derived from it, its contents
+    and placeholders, so that other processes stop using their copies. Local copies are dropped right away.
+    """
+    last_updated = timezone.now()
+    EmailMergeModel.objects.filter(id=template_id).update(last_updated=last_updated)
+    name = EmailMergeModel.objects.filter(id=template_id).values_list('name', flat=True).first()
+    evict_template(template_id, name, last_updated)
+    return last_updated
+
+
+def evict_template(template_id, name=None, last_updated=None):
+    compiled_templates.delete_matching(lambda key: key[0] == template_id)
+    evict_placeholders(template_id)
+    if name is not None:
+        evict_cached_template(name, last_updated)
+
+
+@receiver(post_save, sender=PlaceholderContent)
+@receiver(post_delete, sender=PlaceholderContent)
+@receiver(post_save, sender=EmailMergeContentModel)
+@receiver(post_delete, sender=EmailMergeContentModel)
+def template_content_changed(sender, instance, **kwargs):
+    touch_template(instance.emailmerge_id)
+
+
+@receiver(m2m_changed, sender=EmailMergeModel.extra_recipients.through)
+def extra_recipients_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        for template_id in (pk_set or []) if reverse else [instance.id]:
+            touch_template(template_id)
+
+
+@receiver(m2m_changed, sender=EmailMergeContentModel.extra_attachments.through)
+def extra_attachments_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        if reverse:
+            template_ids = EmailMergeContentModel.objects.filter(id__in=pk_set or []).values_list(
+                'emailmerge_id', flat=True)
+        else:
+            template_ids = [instance.emailmerge_id]
+        for template_id in set(template_ids):
+            touch_template(template_id)
+
+
+@receiver(post_delete, sender=EmailMergeModel)
+def template_deleted(sender, instance, **kwargs):
+    evict_template(instance.id, instance.name)
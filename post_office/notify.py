@@ -0,0 +1,97 @@
+import os
+import select
+
+from django.db import connections, router
+
+from post_office.models import EmailModel
+from post_office.settings import get_notify_channel
+
+
+def supports_notifications(connection):
+    return connection.vendor == 'postgresql'
+
+
+def notify_queued(sender, emails, **kwargs):
+    """
+    Connected to :data:`post_office.signals.email_queued` when ``NOTIFY_CHANNEL`` is set.
+    On PostgreSQL it issues a ``NOTIFY``, which the database only delivers to listening
+    workers once the surrounding transaction is committed. Other databases are left alone.
+    """
+    connection = connections[router.db_for_write(EmailModel)]
+    if emails and supports_notifications(connection):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [get_notify_channel(), ''])
+
+
+class QueueListener:
+    """
+    Waits on ``NOTIFY_CHANNEL`` for emails to be queued, over a dedicated database connection.
+
+    Usage:
+
+    ```
+    listener = QueueListener.create()
+    if listener:
+        listener.wait(timeout=30)  # returns True if emails were queued meanwhile
+        listener.close()
+    ```
+    ``create`` returns ``None`` if notifications are disabled or the database does not support them,
+    in which case workers have to keep polling. ``interrupt`` can safely be called from a signal handler
+    to make a pending ``wait`` return early.
+    """
+
+    def __init__(self, connection, channel):
+        self.connection = connection
+        self.connection.ensure_connection()
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'LISTEN {self.connection.ops.quote_name(channel)}')
+        self.interrupt_fd, self._interrupt_write_fd = os.pipe()
+
+    @classmethod
+    def create(cls, using=None):
+        channel = get_notify_channel()
+        connection = connections.create_connection(using or router.db_for_write(EmailModel))
+        if not channel or not supports_notifications(connection):
+            return None
+        return cls(connection, channel)
+
+    def wait(self, timeout):
+        raw_connection = self.connection.connection
+        readable, _, _ = select.select([raw_connection, self.interrupt_fd], [], [], timeout)
+        if self.interrupt_fd in readable:
+            os.read(self.interrupt_fd, 1024)
+        return self._drain(raw_connection) > 0
+
+    def interrupt(self):
+        os.write(self._interrupt_write_fd, b'\0')
+
+    def close(self):
+        try:
+            self.connection.close()
+        finally:
+            os.close(self.interrupt_fd)
+            os.close(self._interrupt_write_fd)
+
+    @staticmethod
+    def _drain(raw_connection):
+        if hasattr(raw_connection, 'poll'):
+            # psycopg2 buffers received notifications on the connection
+            raw_connection.poll()
+            count = len(raw_connection.notifies)
+            raw_connection.notifies.clear()
+            return count
+        # psycopg 3
+        try:
+            notifies = raw_connection.notifies(timeout=0)
+        except TypeError:
+            # Before psycopg 3.2 notifies() blocks until a notification arrives. Received notifications
+            # are handed to notify handlers whenever the connection processes a result, e.g. of a query.
+            received = []
+            handler = received.append
+            raw_connection.add_notify_handler(handler)
+            try:
+                raw_connection.execute('SELECT 1')
+            finally:
+                raw_connection.remove_notify_handler(handler)
+            return len(received)
+        return sum(1 for _ in notifies)
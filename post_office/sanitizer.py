@@ -1,6 +1,11 @@
+import hashlib
+
 from django.utils.html import mark_safe, format_html
 from django.utils.translation import gettext_lazy
 
+from .cache_utils import LocalCache
+from .settings import get_sanitizer_cache_size
+
 try:
     import nh3
 except ImportError:
@@ -8,7 +13,7 @@ except ImportError:
     heading = gettext_lazy("Install 'nh3' to render HTML properly.")
 
 
-    def clean_html(body):
+    def _clean_html(body):
         return format_html('<p><em>{heading}</em></p>\n<div>{body}</div>', heading=heading, body=body)
 else:
     styles = [
@@ -214,7 +219,7 @@ else:
         new_attrs[tag] = set(attrs)
 
 
-    def clean_html(body):
+    def _clean_html(body):
         return mark_safe(
             nh3.clean(
                 body,
@@ -223,3 +228,30 @@ else:
                 strip_comments=True,
             )
         )
+
+# Sanitized HTML keyed by the SHA-256 digest of its source
+sanitized_cache = LocalCache(maxsize=get_sanitizer_cache_size)
+
+
+def clean_html(body):
+    """
+    Sanitizes HTML. Results are memoized, since the same placeholder contents and context
+    values are sanitized for every email of a campaign.
+    """
+    key = hashlib.sha256(str(body).encode()).digest()
+    cleaned = sanitized_cache.get(key)
+    if cleaned is None:
+        cleaned = _clean_html(body)
+        sanitized_cache.set(key, cleaned)
+    return cleaned
+
+
+def clean_html_many(bodies):
+    """
+    Sanitizes many values in one call, returning them in the same order. Each distinct value is sanitized once.
+    """
+    cleaned = {}
+    for body in bodies:
+        if body not in cleaned:
+            cleaned[body] = clean_html(body)
+    return [cleaned[body] for body in bodies]
@@ -94,6 +94,10 @@ def get_batch_size():
     return get_config().get('BATCH_SIZE', 100)
 
 
+def get_send_many_chunk_size():
+    return get_config().get('SEND_MANY_CHUNK_SIZE', 1000)
+
+
 def get_celery_enabled():
     return get_config().get('CELERY_ENABLED', False)
 
@@ -131,6 +135,10 @@ def get_message_id_enabled():
     return get_config().get('MESSAGE_ID_ENABLED', False)
 
 
+def get_render_cache_enabled():
+    return get_config().get('RENDER_CACHE_ENABLED', False)
+
+
 def get_message_id_fqdn():
     return get_config().get('MESSAGE_ID_FQDN', DNS_NAME)
 
@@ -140,5 +148,41 @@ def get_batch_delivery_timeout():
     return get_config().get('BATCH_DELIVERY_TIMEOUT', 180)
 
 
+def get_delivery_connections():
+    return get_config().get('DELIVERY_CONNECTIONS', 1)
+
+
+def get_async_connections():
+    return get_config().get('ASYNC_CONNECTIONS', 10)
+
+
+def get_sanitizer_cache_size():
+    return get_config().get('SANITIZER_CACHE_SIZE', 1024)
+
+
+def get_attachment_cache_size():
+    return get_config().get('ATTACHMENT_CACHE_SIZE', 0)
+
+
+def get_streamed_attachment_size():
+    return get_config().get('STREAMED_ATTACHMENT_SIZE', 1024 * 1024)
+
+
+def get_lease_duration():
+    return get_config().get('LEASE_DURATION', datetime.timedelta(seconds=2 * get_batch_delivery_timeout()))
+
+
+def get_notify_channel():
+    return get_config().get('NOTIFY_CHANNEL')
+
+
+def get_template_cache_timeout():
+    return get_config().get('TEMPLATE_CACHE_TIMEOUT', 5)
+
+
+def get_inline_image_cache_timeout():
+    return get_config().get('INLINE_IMAGE_CACHE_TIMEOUT', 5)
+
+
 def get_base_files():
     return get_config().get('BASE_FILES', [])
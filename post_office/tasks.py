@@ -9,10 +9,9 @@ import datetime
 
 from django.utils.timezone import now
 
-from post_office.mail import _send_bulk, get_queued
+from post_office.mail import _send_bulk, claim_queued
 from post_office.utils import cleanup_expired_mails
 from django.db import connection as db_connection
-from django.db import transaction
 
 from .settings import get_celery_enabled
 
@@ -36,16 +35,9 @@ else:
         To be called by the Celery task manager.
         """
 
-        while True:
-            queued_emails = get_queued().select_for_update(of=('self',), skip_locked=True)
-            with transaction.atomic():
-                try:
-                    _send_bulk(queued_emails, uses_multiprocessing=False)
-                except Exception as e:
-                    raise e
-
-                if not get_queued().select_for_update(of=('self',), skip_locked=True).exists():
-                    break
+        # Every batch is leased to this worker, so that concurrent tasks never send the same email
+        while queued_emails := claim_queued():
+            _send_bulk(queued_emails, uses_multiprocessing=False)
             db_connection.close()
 
 
@@ -12,7 +12,6 @@ def render_to_string(template_name, context=None, request=None, using=None):
         template = select_template(template_name, using=using)
     else:
         template = get_template(template_name, using=using)
-    try:
-        return template.render(context, request), template.template._attached_images
-    except Exception:
-        return template.render(context, request)
+    if hasattr(template, 'render_with_images'):
+        return template.render_with_images(context, request)
+    return template.render(context, request)
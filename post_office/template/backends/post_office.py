@@ -1,20 +1,47 @@
+from threading import local
+
 from django.conf import settings
 from django.core.mail import EmailMultiAlternatives
 from django.template import TemplateDoesNotExist
 from django.template.backends.base import BaseEngine
 from django.template.backends.django import Template as DjangoTemplate, reraise, get_installed_libraries
+from django.template.context import make_context
 from django.template.engine import Engine
 
 
 class Template(DjangoTemplate):
     def __init__(self, template, backend):
-        template._attached_images = []
         super().__init__(template, backend)
+        # Compiled templates are shared, so the images of the latest rendering are kept per thread
+        self._local = local()
+
+    def render_with_images(self, context=None, request=None):
+        """
+        Renders the template and returns the result together with the images referenced through ``inline_image``.
+        The images are collected on the context of this rendering, so concurrent renderings do not mix them up.
+        """
+        context = make_context(context, request, autoescape=self.backend.engine.autoescape)
+        context.attached_images = []
+        try:
+            return self.template.render(context), context.attached_images
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self.backend)
+
+    def render(self, context=None, request=None):
+        rendered, self._local.attached_images = self.render_with_images(context, request)
+        return rendered
+
+    @property
+    def attached_images(self):
+        """
+        The images of the latest rendering in the current thread.
+        """
+        return getattr(self._local, 'attached_images', [])
 
-    def attach_related(self, email_message):
+    def attach_related(self, email_message, images=None):
         assert isinstance(email_message, EmailMultiAlternatives), 'Parameter must be of type EmailMultiAlternatives'
         email_message.mixed_subtype = 'related'
-        for attachment in self.template._attached_images:
+        for attachment in self.attached_images if images is None else images:
             email_message.attach(attachment)
 
 
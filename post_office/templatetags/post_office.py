@@ -1,4 +1,6 @@
-import uuid
+import hashlib
+import time
+from collections import namedtuple
 from email.mime.image import MIMEImage
 from django.core.files.storage import default_storage
 
@@ -7,8 +9,16 @@ from django.conf import settings
 from django.core.files.images import ImageFile
 from django.utils.html import SafeString
 
+from post_office.cache_utils import LocalCache
+from post_office.settings import get_inline_image_cache_timeout
+
 register = template.Library()
 
+# Encoded inline images keyed by (path, modification time)
+inline_images = LocalCache()
+# Modification times of inline images keyed by path, None for missing files
+image_stats = LocalCache()
+ImageStat = namedtuple('ImageStat', 'modified checked')
 
 
 @register.simple_tag(takes_context=True)
@@ -21,27 +31,100 @@ def inline_image(context, file):
         return f"{settings.MEDIA_URL}{file_name}"
 
     assert hasattr(
-        context.template, '_attached_images'
+        context, 'attached_images'
     ), "You must use template engine 'post_office' when rendering images using templatetag 'inline_image'."
     if isinstance(file, ImageFile):
-        fileobj = file
-    else:
-        if default_storage.exists(file):
-            fileobj = default_storage.open(file)
+        image = get_mime_image(file.read())
+    elif (image := get_inline_image(file)) is None:
+        if settings.DEBUG:
+            raise FileNotFoundError(f"No such file or directory: {file}")
         else:
-            if settings.DEBUG:
-                raise FileNotFoundError(f"No such file or directory: {file}")
-            else:
-                return ''
-    raw_data = fileobj.read()
+            return ''
+    # The same image used several times in one email is attached only once
+    if all(attached['Content-ID'] != image['Content-ID'] for attached in context.attached_images):
+        context.attached_images.append(image)
+    return f"cid:{image['Content-ID'][1:-1]}"
+
+
+def get_inline_image(path):
+    """
+    Returns the image stored at ``path`` as a MIME part, or ``None`` if there is no such file.
+    The path is kept as ``storage_path`` of the part, so that it can be loaded again later.
+    """
+    try:
+        if (modified := get_modified_time(path)) is None:
+            return None
+    except NotImplementedError:
+        # Without modification times a replaced image can not be told apart, so it is read every time
+        return load_inline_image(path) if default_storage.exists(path) else None
+    key = (path, modified)
+    image = inline_images.get(key)
+    if image is None:
+        image = load_inline_image(path)
+        inline_images.set(key, image)
+    return image
+
+
+def load_inline_image(path):
+    with default_storage.open(path) as fileobj:
+        image = get_mime_image(fileobj.read())
+    image.storage_path = path
+    return image
+
+
+def get_modified_time(path):
+    """
+    Returns the modification time of the file at ``path``, or ``None`` if there is no such file.
+    The storage is asked again once the last answer is older than ``INLINE_IMAGE_CACHE_TIMEOUT`` seconds.
+    """
+    now = time.monotonic()
+    stat = image_stats.get(path)
+    if stat is None or now - stat.checked >= get_inline_image_cache_timeout():
+        modified = default_storage.get_modified_time(path) if default_storage.exists(path) else None
+        stat = ImageStat(modified, now)
+        image_stats.set(path, stat)
+    return stat.modified
+
+
+def get_mime_image(raw_data):
+    """
+    Returns the image as a MIME part, with a Content-ID derived from its content.
+    """
     image = MIMEImage(raw_data)
-    md5sum = uuid.uuid4().hex
-    image.add_header('Content-Disposition', 'inline', filename=md5sum)
-    image.add_header('Content-ID', f'<{md5sum}>')
-    context.template._attached_images.append(image)
-    return f'cid:{md5sum}'
+    content_id = hashlib.sha256(raw_data).hexdigest()[:32]
+    image.add_header('Content-Disposition', 'inline', filename=content_id)
+    image.add_header('Content-ID', f'<{content_id}>')
+    return image
 
 
-@register.simple_tag
 def placeholder(name: str) -> str:
-    return f"{{{{{name}}}}}"
\ No newline at end of file
+    return f"{{{{{name}}}}}"
+
+
+class PlaceholderNode(template.Node):
+    """
+    Renders the content of a placeholder, if the contents were passed in the context as ``placeholder_contents``.
+    Contents may be strings, which are inserted as they are, or compiled templates rendered with the current context.
+    Otherwise the placeholder is replaced by a ``{{ name }}`` variable to be filled in a later pass.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def render(self, context):
+        name = self.name.resolve(context)
+        contents = context.get('placeholder_contents')
+        if contents is None:
+            return placeholder(name)
+        content = contents.get(name, '')
+        if isinstance(content, str):
+            return content
+        return content.render(context)
+
+
+@register.tag(name='placeholder')
+def do_placeholder(parser, token):
+    bits = token.split_contents()
+    if len(bits) != 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag takes exactly one argument, the placeholder name")
+    return PlaceholderNode(parser.compile_filter(bits[1]))
\ No newline at end of file
@@ -1,18 +1,26 @@
-from typing import List, Optional, Union
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Union
 from .logutils import setup_loghandlers
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.files import File
 from django.core.files.storage import default_storage
 from django.utils.encoding import force_str
-from post_office import cache
-from .models import EmailModel, PRIORITY, STATUS, EmailMergeModel, Attachment, EmailAddress, Recipient
-from .settings import get_default_priority, get_default_language, get_languages_list
+from .cache_utils import get_cached_template
+from .models import (
+    EmailModel, PRIORITY, STATUS, EmailMergeModel, Attachment, EmailAddress, Recipient,
+)
+from .settings import get_attachments_storage, get_default_priority, get_default_language, get_languages_list
 from .signals import email_queued
-from .validators import validate_email_with_name
+from .validators import get_invalid_emails
 
 logger = setup_loghandlers('WARN')
 
+# Number of addresses inserted and selected per query by resolve_addresses()
+ADDRESS_CHUNK_SIZE = 500
+
 
 def send_mail(
         subject,
@@ -35,6 +43,7 @@ def send_mail(
 
     subject = force_str(subject)
     status = None if priority == PRIORITY.now else STATUS.queued
+    addresses = resolve_addresses(recipient_list)
     emails = []
     for address in recipient_list:
         email = EmailModel.objects.create(
@@ -48,13 +57,13 @@ def send_mail(
             scheduled_time=scheduled_time,
             language=language,
         )
-        set_recipients(email, [get_or_create_recipient(address)])
+        set_recipients(email, [addresses[get_address_key(address)]])
 
         emails.append(email)
 
     if priority == PRIORITY.now:
-        for email in emails:
-            email.dispatch()
+        from .mail import dispatch_now
+        dispatch_now(emails)
     else:
         email_queued.send(sender=EmailModel, emails=emails)
     return emails
@@ -70,14 +79,10 @@ def get_email_template(name):
     if not use_cache:
         return EmailMergeModel.objects.get(name=name)
     else:
-        composite_name = '%s' % name
-        email_template = cache.get(composite_name)
-
-        if email_template is None:
-            email_template = EmailMergeModel.objects.get(name=name)
-            cache.set(composite_name, email_template)
-
-        return email_template
+        # Translated contents and extra recipients are cached along with the template
+        return get_cached_template(name, lambda: EmailMergeModel.objects.prefetch_related(
+            'translated_contents__extra_attachments', 'extra_recipients',
+        ).get(name=name))
 
 
 def split_emails(emails, split_count=1):
@@ -98,6 +103,9 @@ def create_attachments(attachment_files):
         * Key - the filename to be used for the attachment.
         * Value - file-like object, or a filename to open OR a dict of {'file': file-like-object, 'mimetype': string}
 
+    Attachments are content addressed: an existing Attachment with the same content, name, mimetype
+    and headers is reused, and a file is written to storage only once per distinct content.
+
     Returns a list of Attachment objects
     """
     attachments = []
@@ -121,15 +129,10 @@ def create_attachments(attachment_files):
                 raise FileNotFoundError(f'File {content} not found in storage.')
 
             content = File(opened_file)
+        elif not hasattr(content, 'chunks'):
+            content = File(content)
 
-        attachment = Attachment()
-        if mimetype:
-            attachment.mimetype = mimetype
-        attachment.headers = headers
-        attachment.name = filename
-        attachment.file.save(filename, content=content, save=True)
-
-        attachments.append(attachment)
+        attachments.append(get_or_create_attachment(content, filename, mimetype or '', headers))
 
         if opened_file is not None:
             opened_file.close()
@@ -137,6 +140,48 @@ def create_attachments(attachment_files):
     return attachments
 
 
+def get_or_create_attachment(content, name, mimetype='', headers=None):
+    content_digest = get_content_digest(content)
+    digest = get_attachment_digest(content_digest, name, mimetype, headers)
+    try:
+        return Attachment.objects.get(digest=digest)
+    except Attachment.DoesNotExist:
+        pass
+
+    storage = get_attachments_storage()
+    path = get_content_path(content_digest)
+    stored_path = path if storage.exists(path) else storage.save(path, content)
+
+    attachment, created = Attachment.objects.get_or_create(
+        digest=digest,
+        defaults={'file': stored_path, 'name': name, 'mimetype': mimetype, 'headers': headers},
+    )
+    if not created and stored_path not in (path, attachment.file.name):
+        # A concurrent process stored the same content meanwhile
+        storage.delete(stored_path)
+    return attachment
+
+
+def get_content_digest(content):
+    hasher = hashlib.sha256()
+    for chunk in content.chunks():
+        hasher.update(chunk.encode() if isinstance(chunk, str) else chunk)
+    content.seek(0)
+    return hasher.hexdigest()
+
+
+def get_attachment_digest(content_digest, name, mimetype, headers):
+    """
+    Identifies an Attachment by its content and everything else that ends up in the email.
+    """
+    key = json.dumps([content_digest, name, mimetype, headers], sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def get_content_path(content_digest):
+    return os.path.join('post_office_attachments', content_digest[:2], content_digest)
+
+
 def parse_priority(priority):
     if priority is None:
         priority = get_default_priority()
@@ -155,6 +200,7 @@ def parse_emails(emails):
     This function will also convert a single email address into
     a list of email addresses.
     None value is also converted into an empty list.
+    All invalid addresses are reported in a single ValidationError.
     """
 
     if isinstance(emails, str):
@@ -162,62 +208,85 @@ def parse_emails(emails):
     elif emails is None:
         emails = []
 
-    for email in emails:
-        try:
-            validate_email_with_name(email)
-        except ValidationError:
-            raise ValidationError('%s is not a valid email address' % email)
+    if invalid_emails := get_invalid_emails(emails):
+        raise ValidationError(['%s is not a valid email address' % email for email in invalid_emails])
 
     return emails
 
 
 def get_or_create_recipient(email: str) -> EmailAddress:
-    obj, _ = EmailAddress.objects.get_or_create(email=email)
-    return obj
+    return resolve_addresses([email])[email]
 
 
-def get_recipients_objects(emails: List[Union[str, EmailAddress]]) -> List[EmailAddress]:
-    unique_emails = []
-    seen = set()
+def get_address_key(address: Union[str, EmailAddress]) -> str:
+    return address.email if isinstance(address, EmailAddress) else address
 
-    # Separate strings from EmailAddress instances and deduplicate
-    for email in emails:
-        email_str = email.email if isinstance(email, EmailAddress) else email
-        if email_str not in seen:
-            unique_emails.append(email)
-            seen.add(email_str)
 
-    # Filter only string emails to check existing recipients in the database
-    email_strings = [email for email in unique_emails if isinstance(email, str)]
-    existing_recipients = EmailAddress.objects.filter(email__in=email_strings)
-    existing_emails = {recipient.email: recipient for recipient in existing_recipients}
+def resolve_addresses(emails: Iterable[Union[str, EmailAddress]]) -> Dict[str, EmailAddress]:
+    """
+    Returns a mapping of each given address to its ``EmailAddress``, including blocked ones.
+    Missing addresses are inserted in chunks, skipping those created concurrently by other processes,
+    and then selected again, so resolving any number of addresses takes a few queries per chunk.
+    Unsaved ``EmailAddress`` instances are saved that way as well, unless their address already exists.
+    """
+    addresses = {}
+    unsaved = {}
+    given = set()
+    for email in emails:
+        key = get_address_key(email)
+        if key in addresses or key in unsaved:
+            continue
+        if not isinstance(email, EmailAddress):
+            unsaved[key] = EmailAddress(email=email)
+        elif email.pk:
+            addresses[key] = email
+        else:
+            unsaved[key] = email
+            given.add(key)
+
+    unsaved_keys = list(unsaved)
+    for start in range(0, len(unsaved_keys), ADDRESS_CHUNK_SIZE):
+        chunk = unsaved_keys[start:start + ADDRESS_CHUNK_SIZE]
+        existing = {address.email: address for address in EmailAddress.objects.filter(email__in=chunk)}
+        missing = {key for key in chunk if key not in existing}
+        if missing:
+            EmailAddress.objects.bulk_create([unsaved[key] for key in chunk if key in missing], ignore_conflicts=True)
+            existing.update((address.email, address) for address in EmailAddress.objects.filter(email__in=missing))
+        for key in chunk:
+            address = existing[key]
+            if key in given and key in missing:
+                # Hand back the caller's instance, now saved
+                instance = unsaved[key]
+                instance.pk = address.pk
+                instance.is_blocked = address.is_blocked
+                instance._state.adding = False
+                instance._state.db = address._state.db
+                address = instance
+            addresses[key] = address
+
+    return addresses
+
+
+def get_recipients_objects(emails: List[Union[str, EmailAddress]],
+                           addresses: Optional[Dict[str, EmailAddress]] = None) -> List[EmailAddress]:
+    """
+    Returns the ``EmailAddress`` of each unique address in ``emails`` that is not blocked, in order.
+    ``addresses`` may be the result of a previous ``resolve_addresses()`` call covering ``emails``.
+    """
+    if addresses is None:
+        addresses = resolve_addresses(emails)
 
     recipient_objects = []
-    to_create_objects = []
-
-    for email in unique_emails:
-        if isinstance(email, EmailAddress):
-            if email.pk:
-                if not email.is_blocked:
-                    recipient_objects.append(email)
-                else:
-                    logger.warning(f"User {email.email} is blocked and hence will be excluded")
-            else:
-                to_create_objects.append(email)
+    seen = set()
+    for email in emails:
+        key = get_address_key(email)
+        if key in seen:
+            continue
+        seen.add(key)
+        if (address := addresses[key]).is_blocked:
+            logger.warning(f"User {key} is blocked and hence will be excluded")
         else:
-            if email in existing_emails:
-                obj = existing_emails[email]
-                if obj.is_blocked:
-                    logger.warning(f"User {email} is blocked and hence will be excluded")
-                else:
-                    recipient_objects.append(obj)
-            else:
-                to_create_objects.append(EmailAddress(email=email))
-
-    # Bulk create new recipients
-    if to_create_objects:
-        created_objects = EmailAddress.objects.bulk_create(to_create_objects)
-        recipient_objects.extend(created_objects)
+            recipient_objects.append(address)
 
     return recipient_objects
 
@@ -267,18 +336,21 @@ def cleanup_expired_mails(cutoff_date, delete_attachments=True, batch_size=1000)
 
     attachments_count = 0
     if delete_attachments:
+        storage = get_attachments_storage()
         while True:
-            attachments = Attachment.objects.filter(emails=None)[:batch_size]
+            attachments = Attachment.objects.filter(emails=None, extra_attachments=None)[:batch_size]
             if not attachments:
                 break
-            attachment_ids = set()
-            for attachment in attachments:
-                # Delete the actual file
-                attachment.file.delete()
-                attachment_ids.add(attachment.id)
+            attachment_ids = {attachment.id for attachment in attachments}
+            file_names = {attachment.file.name for attachment in attachments}
             deleted_count, _ = Attachment.objects.filter(id__in=attachment_ids).delete()
             attachments_count += deleted_count
 
+            # Files with identical content are shared, only delete those without any remaining reference
+            file_names.difference_update(Attachment.objects.filter(file__in=file_names).values_list('file', flat=True))
+            for file_name in file_names:
+                storage.delete(file_name)
+
     return total_deleted_emails, attachments_count
 
 
@@ -1,8 +1,21 @@
+import re
+
 from django.core.exceptions import ValidationError
 from django.core.validators import validate_email
 from django.template import Template, TemplateSyntaxError, TemplateDoesNotExist
 from django.utils.encoding import force_str
 
+from .cache_utils import LocalCache
+
+# Plain ASCII addresses, a subset of what Django's validate_email() accepts
+PLAIN_EMAIL_RE = re.compile(
+    r"[-!#$%&'*+/=?^_`{}|~0-9A-Z]+(?:\.[-!#$%&'*+/=?^_`{}|~0-9A-Z]+)*"
+    r"@(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,63}",
+    re.IGNORECASE | re.ASCII,
+)
+# Verdicts for addresses not matching PLAIN_EMAIL_RE, e.g. those with a name
+email_verdicts = LocalCache(maxsize=4096)
+
 
 def validate_email_with_name(value):
     """
@@ -22,6 +35,27 @@ def validate_email_with_name(value):
     validate_email(recipient)
 
 
+def is_valid_email(value):
+    if len(value) <= 320 and PLAIN_EMAIL_RE.fullmatch(value):
+        return True
+    valid = email_verdicts.get(value)
+    if valid is None:
+        try:
+            validate_email_with_name(value)
+            valid = True
+        except ValidationError:
+            valid = False
+        email_verdicts.set(value, valid)
+    return valid
+
+
+def get_invalid_emails(values):
+    """
+    Returns the values which ``validate_email_with_name`` rejects, each once and in order.
+    Duplicates are checked once and plain addresses skip the full validation.
+    """
+    unique_values = dict.fromkeys(value if isinstance(value, str) else force_str(value) for value in values)
+    return [value for value in unique_values if not is_valid_email(value)]
 
 
 def validate_template_syntax(source):